@@ -1,67 +1,453 @@
-from flask import Flask, jsonify, render_template, request
+import hmac
+import json
+import os
+import time
+from flask import Flask, g, jsonify, render_template, request, stream_with_context
 import pandas as pd
-import data_transform_functions as f
+import compression
+import data_cache as dc
+import metrics
+from chart_engine import BINARY_MIMETYPE, series_binary, series_chunks
+from dataset_registry import DatasetHolder, DatasetRegistry
+from profiling import SlowRequestProfiler
+from response_cache import PinnedResponses, ResponseCache, make_etag
 
 # Initialize the Flask application
 app = Flask(__name__)
 
-# Input and transform housing list price data:
-df_price = f.home_price_inventory_transform('data/Metro_mlp_uc_sfr_sm_month.csv') # Mean list price SFH
-df_inv = f.home_price_inventory_transform('data/Metro_invt_fs_uc_sfr_sm_month.csv') # Inventory
-
-# --- Chart Data ---
-# This data is now managed by the backend
-# --- Color Palette for Chart Lines ---
-# A list of colors to cycle through for different cities
-COLOR_PALETTE = [
-    '#FF6385', '#36A2EB', '#FFCE56', '#4BC0C0', 
-    '#9966FF', '#FF9F40', '#C9CBCF', '#7CFFB2' 
-]
-
-# Transparent versions colors to cycle through for different cities.
-COLOR_PALETTE2 = [
-    "#FF638576", "#36A3EB7A", "#FFCF567D", "#4BC0C07F", 
-    "#9966FF7E","#FFA04078", "#C9CBCF7D", "#7CFFB379" 
-]
-
-def process_chart_data_request(df):
-    """Helper function to process data for a given DataFrame."""
-    selected_cities_str = request.args.get('cities')
-    
-    if not selected_cities_str:
-        return jsonify({"error": "No cities selected"}), 400
-
-    # Format the city strings to match the dataset format    
+# Folder holding the Zillow csv files (transformed copies are cached in data/cache)
+DATA_DIR = os.environ.get('HOUSING_DATA_DIR', 'data')
+
+# 'memory' gives each worker its own dataframes, 'mmap' maps the cached
+# matrices read-only so all workers share one copy of the data
+DATA_MODE = os.environ.get('HOUSING_DATA_MODE', 'memory')
+
+# Series loaded in a background thread at startup; everything else is
+# loaded on first request
+PRELOAD = os.environ.get('HOUSING_PRELOAD', 'price,inventory')
+
+# Seconds between checks of data/cache/published.json for newly ingested
+# data (0 turns the watcher off)
+WATCH_INTERVAL = float(os.environ.get('HOUSING_WATCH_INTERVAL', 10))
+
+# Whether api responses are gzip (or brotli, when installed) compressed for
+# clients that accept it; turn off when a proxy in front compresses instead
+COMPRESS = os.environ.get('HOUSING_COMPRESS', '1') != '0'
+
+# Token required by the /api/admin/reload endpoint (unset disables it)
+ADMIN_TOKEN = os.environ.get('HOUSING_ADMIN_TOKEN')
+
+# Requests slower than this many milliseconds have their profile written to
+# HOUSING_PROFILE_DIR (unset turns profiling off). HOUSING_PROFILE_SAMPLE is
+# the share of requests profiled and HOUSING_PROFILE_MODE is 'cprofile' for
+# .prof files or 'stacks' for flame graph ready collapsed stacks.
+profiler = SlowRequestProfiler(
+    threshold_ms=float(os.environ.get('HOUSING_PROFILE_SLOW_MS', 0)) or None,
+    sample_rate=float(os.environ.get('HOUSING_PROFILE_SAMPLE', 1.0)),
+    mode=os.environ.get('HOUSING_PROFILE_MODE', 'cprofile'),
+    directory=os.environ.get('HOUSING_PROFILE_DIR', 'profiles'),
+)
+
+# Most matches /api/cities?q=... returns for one search
+MAX_SEARCH_RESULTS = 100
+
+# Most metros /api/rankings returns for one month
+MAX_RANKINGS = 100
+
+# Most metros /api/similar returns for one query
+MAX_SIMILAR = 100
+
+# Metros the page selects on first load (DEFAULT_CITIES in static/script.js),
+# whose chart responses are pinned with the city list
+DEFAULT_CITIES = ('Los Angeles, CA', 'New York, NY')
+
+# --- Datasets ---
+# Every Zillow series is declared in dataset_registry and loaded lazily. The
+# holder swaps in a new snapshot when new data is published; each request
+# works on the snapshot that was current when it started.
+datasets = DatasetHolder(lambda previous: DatasetRegistry(data_dir=DATA_DIR, mode=DATA_MODE,
+                                                          previous=previous))
+if PRELOAD:
+    datasets.current.preload([name for name in PRELOAD.split(',') if name in datasets.current],
+                             background=True)
+if WATCH_INTERVAL > 0:
+    datasets.watch(os.path.join(DATA_DIR, 'cache', 'published.json'), WATCH_INTERVAL)
+
+# Serialized responses keyed on endpoint, normalized city set and data version
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get('HOUSING_RESPONSE_CACHE_ENTRIES', 256)),
+    max_bytes=int(os.environ.get('HOUSING_RESPONSE_CACHE_MB', 32)) * 1024 * 1024,
+)
+
+# The city list and default selection responses, kept out of the LRU for
+# the current dataset generation (one body per encoding, format and chart
+# width the page asks for)
+pinned_responses = PinnedResponses()
+
+# --- Instrumentation ---
+def route_label():
+    """The route pattern of the current request, used as a metric label so
+    the label set stays small."""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def stage(name):
+    """Times a stage of the current request (a with block) into the
+    per-route stage histogram."""
+    return metrics.REQUEST_STAGE_SECONDS.time(route=route_label(), stage=name)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profile = profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    """Records the request's latency and finishes its profile once the body
+    has been sent, so a streamed body is measured too."""
+    route = route_label()
+    method = request.method
+    start = g.request_start
+    profile = g.profile
+    if response.content_length is not None:
+        metrics.RESPONSE_BYTES.observe(response.content_length, route=route,
+                                       content_type=response.mimetype)
+
+    def finish():
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, route=route,
+                                        method=method, status=response.status_code)
+        if profiler.finish(profile, f'{method} {route}') is not None:
+            metrics.SLOW_REQUESTS.inc(route=route)
+
+    response.call_on_close(finish)
+    return response
+
+def cached_response(endpoint, params, engines, build, mimetype='application/json', pin=False):
+    """Returns a response from the response cache, building and storing it
+    on a miss. Responses carry a strong ETag tied to the versions of the
+    datasets they are built from, so a browser re-fetch is answered with a
+    304 and no body. With pin=True the body is kept in pinned_responses,
+    out of reach of the LRU's eviction, while there is room.
+
+    Bodies are compressed for the client's Accept-Encoding and cached
+    compressed, so a hot response is compressed once per dataset version.
+    `build` returns the body, or an iterator of json text chunks that is
+    streamed to the client (compressed as it goes) and cached once it is
+    complete."""
+    versions = tuple(engine.version for engine in engines)
+    encoding = compression.negotiate(request.accept_encodings) if COMPRESS else None
+    etag = make_etag(endpoint, params, versions, mimetype, encoding)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        key = (endpoint, params, versions, mimetype, encoding)
+        body = pinned_responses.get(key, datasets.generation) if pin else None
+        if body is None:
+            body = response_cache.get(key)
+        cache_status = 'HIT'
+        if body is None:
+            cache_status = 'MISS'
+            start = time.perf_counter()
+            body = build()
+            if isinstance(body, (str, bytes)):
+                if isinstance(body, str):
+                    body = body.encode()
+                if encoding is not None:
+                    body = compression.compress(body, encoding)
+                store_body(key, body, pin)
+                metrics.REQUEST_STAGE_SECONDS.observe(time.perf_counter() - start, route=route_label(),
+                                                      stage='serialize')
+        if isinstance(body, bytes):
+            response = app.response_class(body, mimetype=mimetype)
+        else:
+            response = app.response_class(stream_with_context(stream_body(key, body, encoding, pin)),
+                                          mimetype=mimetype)
+            # Otherwise make_conditional reads the whole body for a Content-Length
+            response.implicit_sequence_conversion = False
+        if encoding is not None:
+            response.content_encoding = encoding
+        response.headers['X-Cache'] = cache_status
+    response.set_etag(etag)
+    response.last_modified = max(engine.last_modified for engine in engines)
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
+
+def store_body(key, body, pin):
+    """Stores a response body, pinned when asked and there is room, in the
+    LRU otherwise."""
+    if not (pin and pinned_responses.put(key, body, datasets.generation)):
+        response_cache.put(key, body)
+
+def stream_body(key, chunks, encoding, pin=False):
+    """Encodes, compresses and yields the json text chunks of a response
+    body, then stores the whole body in the response cache. A body whose
+    client went away before the end is not cached."""
+    compressor = compression.Compressor(encoding) if encoding is not None else None
+    parts = []
+    serialize_seconds = 0.0
+    start = time.perf_counter()
+    for chunk in chunks:
+        chunk = chunk.encode()
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        serialize_seconds += time.perf_counter() - start
+        if chunk:
+            parts.append(chunk)
+            yield chunk
+        start = time.perf_counter()
+    if compressor is not None:
+        chunk = compressor.flush()
+        parts.append(chunk)
+        yield chunk
+    serialize_seconds += time.perf_counter() - start
+    body = b''.join(parts)
+    store_body(key, body, pin)
+    route = route_label()
+    metrics.REQUEST_STAGE_SECONDS.observe(serialize_seconds, route=route, stage='serialize')
+    metrics.RESPONSE_BYTES.observe(len(body), route=route, content_type=key[3])
+
+def wants_binary():
+    """Whether the client prefers binary float32 chart frames to json."""
+    return request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE]) == BINARY_MIMETYPE
+
+def cached_chart_response(endpoint, params, engines, build_json, build_binary, pin=False):
+    """Returns a chart response in the format the client asked for with its
+    Accept header: json, or a binary frame with float32 values."""
+    if wants_binary():
+        response = cached_response(endpoint, params, engines, build_binary, BINARY_MIMETYPE, pin)
+    else:
+        response = cached_response(endpoint, params, engines, build_json, pin=pin)
+    response.vary.add('Accept')
+    return response
+
+def parse_city_param(selected_cities_str):
+    """Splits the comma-joined "City, ST" names from the query string."""
     # 1. Split by all commas
     split_by_all_commas = selected_cities_str.split(',')
     # 2. Group elements in pairs
     paired_elements = zip(split_by_all_commas[::2], split_by_all_commas[1::2])
     # 3. Join the pairs with a comma in between
-    selected_cities = [f"{first},{second}" for first, second in paired_elements]
-
-    # Filter the DataFrame to include only the selected cities
-    filtered_df = df[selected_cities]
-    
-    chart_data = {
-        'labels': list(filtered_df.index),
-        'datasets': []
-    }
-    
-    for i, city in enumerate(filtered_df.columns):
-        dataset = {
-            'label': city,
-            'data': list(filtered_df[city]),
-            'fill': False,
-            'borderColor': COLOR_PALETTE[i % len(COLOR_PALETTE)],
-            'backgroundColor': COLOR_PALETTE2[i % len(COLOR_PALETTE2)],
-            'tension': 0.3,
-            'borderWidth': 3,
-            'pointRadius': 3,
-            'pointHoverRadius': 8
-        }
-        chart_data['datasets'].append(dataset)
-       
-    return jsonify(chart_data)
+    return [f"{first},{second}" for first, second in paired_elements]
+
+def is_default_selection(engine, positions):
+    """Whether the resolved positions are the page's DEFAULT_CITIES."""
+    try:
+        return positions == sorted(set(engine.resolve(DEFAULT_CITIES)))
+    except KeyError:
+        return False
+
+def resolve_selection(engine, args):
+    """Returns the column positions of the metros selected with ?ids=
+    (comma-separated RegionIDs) or ?cities= (comma-joined names), sorted and
+    without duplicates so the same set of metros always maps to the same
+    cache entry and payload. The page puts the datasets back in the order
+    the cities were picked and colours them by it. Raises a ValueError with
+    a message for the client if the selection is missing or unknown."""
+    selected_ids_str = args.get('ids')
+    if selected_ids_str:
+        try:
+            selected_ids = [int(region_id) for region_id in selected_ids_str.split(',')]
+        except ValueError:
+            raise ValueError("ids must be comma-separated RegionIDs") from None
+        try:
+            positions = engine.resolve_ids(selected_ids)
+        except KeyError as error:
+            raise ValueError(f"Unknown region id: {error.args[0]}") from None
+    else:
+        selected_cities_str = args.get('cities')
+        if not selected_cities_str:
+            raise ValueError("No cities selected")
+        # Format the city strings to match the dataset format
+        try:
+            positions = engine.resolve(parse_city_param(selected_cities_str))
+        except KeyError as error:
+            raise ValueError(f"Unknown city: {error.args[0]}") from None
+    return sorted(set(positions))
+
+def parse_window_params(args, prefix=''):
+    """Reads the optional range, start, end and max_points query parameters,
+    letting `<name>.<prefix>` override `<name>` when a prefix is given.
+    Raises a ValueError with a message for the client if one is invalid."""
+    def get(name):
+        return args.get(f'{name}.{prefix}', args.get(name)) if prefix else args.get(name)
+
+    time_range = get('range')
+    dates = {}
+    for name in ('start', 'end'):
+        value = get(name)
+        if value is not None:
+            try:
+                value = pd.Timestamp(value).strftime('%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"Invalid {name} date '{value}'") from None
+        dates[name] = value
+    start, end = dates['start'], dates['end']
+    max_points = get('max_points')
+    if max_points is not None:
+        if not max_points.isdigit() or int(max_points) < 3:
+            raise ValueError("max_points must be an integer of at least 3")
+        max_points = int(max_points)
+    return time_range, start, end, max_points
+
+def process_chart_data_request(engine):
+    """Helper function to process data for a given chart engine."""
+    try:
+        with stage('resolve'):
+            positions = resolve_selection(engine, request.args)
+            # Optional time window and downsampling
+            time_range, start, end, max_points = parse_window_params(request.args)
+            lo, hi = engine.window(time_range, start, end)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    if max_points is not None and hi - lo <= max_points:
+        max_points = None
+
+    return cached_chart_response(request.path, (tuple(positions), lo, hi, max_points), [engine],
+                                 lambda: engine.chart_chunks(positions, time_range, start, end, max_points),
+                                 lambda: engine.chart_binary(positions, time_range, start, end, max_points),
+                                 pin=is_default_selection(engine, positions))
+
+def process_series_request(series):
+    """Helper function to build several metrics for one city selection in a
+    single response."""
+    metrics_str = request.args.get('metrics')
+
+    if not metrics_str:
+        return jsonify({"error": "No metrics selected"}), 400
+
+    # Resolve the metrics once, then the selection in each metric's columns
+    names = list(dict.fromkeys(metrics_str.split(',')))
+    unknown = [metric for metric in names if metric not in series]
+    if unknown:
+        return jsonify({"error": f"Unknown metric: {unknown[0]}"}), 400
+    try:
+        engines = {metric: series.get(metric) for metric in names}
+    except FileNotFoundError:
+        return jsonify({"error": "Data for the selected metrics is not available"}), 404
+
+    positions = {}
+    windows = {}
+    bounds = []
+    for metric, engine in engines.items():
+        try:
+            with stage('resolve'):
+                positions[metric] = resolve_selection(engine, request.args)
+                time_range, start, end, max_points = parse_window_params(request.args, metric)
+                lo, hi = engine.window(time_range, start, end)
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 400
+        if max_points is not None and hi - lo <= max_points:
+            max_points = None
+        windows[metric] = (time_range, start, end, max_points)
+        bounds.append((metric, tuple(positions[metric]), lo, hi, max_points))
+
+    return cached_chart_response(request.path, tuple(bounds), list(engines.values()),
+                                 lambda: series_chunks(engines, positions, windows),
+                                 lambda: series_binary(engines, positions, windows),
+                                 pin=all(is_default_selection(engines[metric], positions[metric])
+                                         for metric in engines))
+
+def process_rankings_request(series):
+    """Helper function to rank the metros by a series in one month."""
+    metric = request.args.get('metric')
+    if not metric:
+        return jsonify({"error": "No metric selected"}), 400
+    if metric not in series:
+        return jsonify({"error": f"Unknown metric: {metric}"}), 400
+    try:
+        engine = series.get(metric)
+    except FileNotFoundError:
+        return jsonify({"error": "Data for the selected metric is not available"}), 404
+
+    n = request.args.get('n', '20')
+    if not n.isdigit() or not 1 <= int(n) <= MAX_RANKINGS:
+        return jsonify({"error": f"n must be between 1 and {MAX_RANKINGS}"}), 400
+    order = request.args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        return jsonify({"error": "order must be 'asc' or 'desc'"}), 400
+
+    # The month containing ?date= (default: the latest month)
+    date = request.args.get('date')
+    end = None
+    if date is not None:
+        try:
+            end = (pd.Timestamp(date) + pd.offsets.MonthEnd(0)).strftime('%Y-%m-%d')
+        except ValueError:
+            return jsonify({"error": f"Invalid date '{date}'"}), 400
+    _, hi = engine.window(end=end)
+    if hi == 0:
+        return jsonify({"error": "No data on or before that date"}), 400
+    row = hi - 1
+
+    def build():
+        positions = engine.rankings(row, int(n), ascending=order == 'asc')
+        return json.dumps({
+            'metric': metric,
+            'date': engine.labels[row],
+            'order': order,
+            'rankings': [
+                {'rank': rank, 'id': engine.region_id(engine.names[position]),
+                 'name': engine.names[position], 'value': float(engine.values[row, position])}
+                for rank, position in enumerate(positions, start=1)
+            ],
+        })
+
+    return cached_response(request.path, (metric, row, int(n), order), [engine], build)
+
+def process_similar_request(series):
+    """Helper function to find the metros whose series moved most like a
+    given metro's, optionally only over a time window."""
+    metric = request.args.get('metric', 'price')
+    if metric not in series:
+        return jsonify({"error": f"Unknown metric: {metric}"}), 400
+    try:
+        engine = series.get(metric)
+    except FileNotFoundError:
+        return jsonify({"error": "Data for the selected metric is not available"}), 404
+
+    k = request.args.get('k', '10')
+    if not k.isdigit() or not 1 <= int(k) <= MAX_SIMILAR:
+        return jsonify({"error": f"k must be between 1 and {MAX_SIMILAR}"}), 400
+    try:
+        region_id = request.args.get('id')
+        if region_id is not None:
+            try:
+                region_id = int(region_id)
+            except ValueError:
+                raise ValueError("id must be a RegionID") from None
+            try:
+                position = engine.resolve_ids([region_id])[0]
+            except KeyError:
+                raise ValueError(f"Unknown region id: {region_id}") from None
+        else:
+            city = request.args.get('city')
+            if not city:
+                raise ValueError("No city selected")
+            try:
+                position = engine.positions[city]
+            except KeyError:
+                raise ValueError(f"Unknown city: {city}") from None
+        time_range, start, end, _ = parse_window_params(request.args)
+        lo, hi = engine.window(time_range, start, end)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+
+    def build():
+        matches = engine.similarity_index.similar(position, int(k), lo, hi, limit=engine.n_metros)
+        return json.dumps({
+            'metric': metric,
+            'id': engine.region_id(engine.names[position]),
+            'name': engine.names[position],
+            'start': engine.labels[lo] if hi > lo else None,
+            'end': engine.labels[hi - 1] if hi > lo else None,
+            'similar': [
+                {'id': engine.region_id(engine.names[match]), 'name': engine.names[match],
+                 'correlation': round(correlation, 6), 'months': months}
+                for match, correlation, months in matches
+            ],
+        })
+
+    return cached_response(request.path, (metric, position, int(k), lo, hi), [engine], build)
 
 @app.route('/')
 def home():
@@ -70,18 +456,118 @@ def home():
 
 @app.route('/api/cities')
 def get_cities():
-    """Provides the list of available cities."""
-    return jsonify(list(df_price.columns))
+    """Provides the list of available cities, or the best matches for a
+    search as [{"id": RegionID, "name": ...}] when called with ?q=...&limit=..."""
+    price_engine = datasets.current.get('price')
+    query = request.args.get('q')
+    if query is None:
+        return cached_response(request.path, (), [price_engine],
+                               lambda: price_engine.cities_json, pin=True)
+
+    limit = request.args.get('limit', '20')
+    if not limit.isdigit() or not 1 <= int(limit) <= MAX_SEARCH_RESULTS:
+        return jsonify({"error": f"limit must be between 1 and {MAX_SEARCH_RESULTS}"}), 400
+    matches = price_engine.search_index.search(query, int(limit))
+    return jsonify([{"id": price_engine.region_id(name), "name": name} for name in matches])
 
 @app.route('/api/pricedata')
 def get_price_data():
     """Provides home price chart data."""
-    return process_chart_data_request(df_price)
+    return process_chart_data_request(datasets.current.get('price'))
 
 @app.route('/api/inventorydata')
 def get_inventory_data():
     """Provides home inventory chart data."""
-    return process_chart_data_request(df_inv)
+    return process_chart_data_request(datasets.current.get('inventory'))
+
+@app.route('/api/series')
+def get_series_data():
+    """Provides chart data for several metrics in one response.
+    Example request: /api/series?metrics=price,inventory&ids=394913,753899&range.price=5y"""
+    return process_series_request(datasets.current)
+
+@app.route('/api/rankings')
+def get_rankings():
+    """Provides the top (or bottom) metros by a series in one month.
+    Example request: /api/rankings?metric=inventory_yoy&n=20&order=desc&date=2025-06"""
+    return process_rankings_request(datasets.current)
+
+@app.route('/api/similar')
+def get_similar():
+    """Provides the metros whose series moved most like a given metro's.
+    Example request: /api/similar?city=Austin, TX&metric=price&k=10&range=5y"""
+    return process_similar_request(datasets.current)
+
+@app.route('/api/datasets')
+def get_datasets():
+    """Lists the registered series with their units, cadence and load times."""
+    return jsonify(datasets.current.describe())
+
+RESPONSE_CACHE = metrics.REGISTRY.gauge(
+    'housing_response_cache', 'Response cache and pinned response hits, misses, entries and bytes.', ('stat',))
+RESPONSE_CACHE_HIT_RATIO = metrics.REGISTRY.gauge(
+    'housing_response_cache_hit_ratio', 'Share of response cache lookups that were hits.')
+DATASET_GENERATION = metrics.REGISTRY.gauge(
+    'housing_dataset_generation', 'Number of dataset snapshots loaded, including reloads.')
+DATASET_LOADED = metrics.REGISTRY.gauge(
+    'housing_dataset_loaded', 'Whether a series is loaded in the current snapshot.', ('series',))
+INGEST_LAST_SECONDS = metrics.REGISTRY.gauge(
+    'housing_ingest_last_seconds', 'Time the last ingest of each csv took, from published.json.', ('csv',))
+
+# The published.json ingest records already turned into metrics, by csv
+# stem, and the dataset generation they were last read at
+seen_ingests = {'generation': None, 'records': {}}
+
+@metrics.REGISTRY.collector
+def collect_state():
+    """Sets the gauges for the response cache and the loaded datasets."""
+    stats = response_cache.stats()
+    RESPONSE_CACHE.set(stats['hits'], stat='hits')
+    RESPONSE_CACHE.set(stats['misses'], stat='misses')
+    RESPONSE_CACHE.set(stats['entries'], stat='entries')
+    RESPONSE_CACHE.set(stats['bytes'], stat='bytes')
+    pinned = pinned_responses.stats()
+    RESPONSE_CACHE.set(pinned['hits'], stat='pinned_hits')
+    RESPONSE_CACHE.set(pinned['entries'], stat='pinned_entries')
+    RESPONSE_CACHE.set(pinned['bytes'], stat='pinned_bytes')
+    hits = stats['hits'] + pinned['hits']
+    lookups = hits + stats['misses']
+    RESPONSE_CACHE_HIT_RATIO.set(hits / lookups if lookups else 0.0)
+    DATASET_GENERATION.set(datasets.generation)
+    registry = datasets.current
+    for name in registry.specs:
+        DATASET_LOADED.set(int(registry.is_loaded(name)), series=name)
+
+@metrics.REGISTRY.collector
+def collect_ingests():
+    """Turns the ingest times ingest.py records in published.json into the
+    ingest histogram and gauge, once per dataset reload. ingest.py runs in
+    its own process, so its own metrics never reach /metrics."""
+    if seen_ingests['generation'] == datasets.generation:
+        return
+    seen_ingests['generation'] = datasets.generation
+    for stem, record in dc.read_published(os.path.join(DATA_DIR, 'cache')).items():
+        if 'ingest' not in record or seen_ingests['records'].get(stem) == record:
+            continue
+        seen_ingests['records'][stem] = record
+        metrics.INGEST_SECONDS.observe(record['ingest']['seconds'], mode=record['ingest']['mode'])
+        INGEST_LAST_SECONDS.set(record['ingest']['seconds'], csv=stem)
+
+@app.route('/metrics')
+def get_metrics():
+    """Provides request, stage, payload size, load time and cache metrics
+    in the Prometheus text format."""
+    return app.response_class(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_datasets():
+    """Reloads the datasets from disk and swaps them in without a restart."""
+    authorization = request.headers.get('Authorization', '')
+    if not ADMIN_TOKEN or not hmac.compare_digest(authorization.encode(), f'Bearer {ADMIN_TOKEN}'.encode()):
+        return jsonify({"error": "Not authorized"}), 403
+    generation = datasets.reload()
+    return jsonify({"generation": generation,
+                    "versions": {name: engine.version for name, engine in datasets.current.engines.items()}})
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,218 @@
+# A file to store the ASGI entry point that serves the app from one process
+#
+# Serves every route of the Flask app (/, /api/cities, /api/pricedata,
+# /api/inventorydata and the rest) from a single process, so the datasets
+# are loaded once however many connections are open. Connections are held
+# by the ASGI server's event loop; each request runs the Flask app in a
+# bounded thread pool, where the selection lookup, serialization and
+# compression happen, and its body is handed back to the event loop chunk
+# by chunk so a slow client never holds a worker thread.
+#
+# Run with any ASGI server, with a single worker process:
+#   uvicorn asgi:application --host 0.0.0.0 --port 8000
+#   hypercorn asgi:application --bind 0.0.0.0:8000
+# or `python asgi.py` when uvicorn is installed.
+
+# Imports
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from app import app
+
+# Threads running requests at once. The json and numpy work drops the GIL
+# for part of the time, so a few threads per core keep the cores busy.
+THREADS = int(os.environ.get('HOUSING_ASGI_THREADS', min(32, (os.cpu_count() or 1) * 4)))
+
+# Requests waiting for a thread beyond which new ones get a 503 straight
+# away instead of queueing without bound
+MAX_PENDING = int(os.environ.get('HOUSING_ASGI_MAX_PENDING', 1024))
+
+# Largest request body read into memory (the api only takes GET requests
+# and the small admin POST)
+MAX_BODY = 1024 * 1024
+
+IN_FLIGHT = metrics.REGISTRY.gauge(
+    'housing_asgi_requests_in_flight', 'Requests accepted by the ASGI server and not yet answered.')
+REJECTED = metrics.REGISTRY.counter(
+    'housing_asgi_rejected_total', 'Requests answered with a 503 because too many were pending.')
+
+# Functions
+def wsgi_environ(scope, body):
+    '''Returns the WSGI environ for an ASGI http scope and request body.'''
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        # WSGI carries the raw path bytes as latin-1 text
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        name = f'HTTP_{name}'
+        if name in environ:
+            value = environ[name] + ('; ' if name == 'HTTP_COOKIE' else ',') + value
+        environ[name] = value
+    return environ
+
+def run_wsgi(wsgi_app, environ, emit):
+    '''Runs a WSGI app in a worker thread, passing ('start', status,
+    headers), ('body', chunk) and finally ('end',) messages to emit.'''
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in headers]
+
+    started = False
+    iterable = wsgi_app(environ, start_response)
+    try:
+        for chunk in iterable:
+            if not chunk:
+                continue
+            if not started:
+                emit(('start', response['status'], response['headers']))
+                started = True
+            emit(('body', chunk))
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    if not started:
+        emit(('start', response['status'], response['headers']))
+    emit(('end',))
+
+async def send_status(send, status, text):
+    '''Sends a short plain text response.'''
+    body = text.encode()
+    headers = [(b'content-type', b'text/plain; charset=utf-8'),
+               (b'content-length', str(len(body)).encode())]
+    if status == 503:
+        headers.append((b'retry-after', b'1'))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+# Classes
+class AsgiApp:
+    '''Serves a WSGI app over ASGI from a bounded pool of worker threads.'''
+
+    def __init__(self, wsgi_app, threads=THREADS, max_pending=MAX_PENDING):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.max_pending = max_pending
+        self.executor = None
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type '{scope['type']}'")
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='asgi-worker')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown(wait=True)
+                    self.executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        '''Returns the request body, or None if it is larger than MAX_BODY.'''
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return b''
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def http(self, scope, receive, send):
+        if self.in_flight >= self.threads + self.max_pending:
+            REJECTED.inc()
+            await send_status(send, 503, 'Server busy, try again')
+            return
+        self.in_flight += 1
+        IN_FLIGHT.set(self.in_flight)
+        try:
+            body = await self.read_body(receive)
+            if body is None:
+                await send_status(send, 413, 'Request body too large')
+                return
+            self.start()
+            loop = asyncio.get_running_loop()
+            queue = asyncio.Queue()
+
+            def emit(message):
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+
+            worker = loop.run_in_executor(self.executor, run_wsgi, self.wsgi_app,
+                                          wsgi_environ(scope, body), emit)
+            worker.add_done_callback(lambda future: future.exception() and emit(('error',)))
+            started = False
+            while True:
+                message = await queue.get()
+                if message[0] == 'start':
+                    _, status, headers = message
+                    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+                    started = True
+                elif message[0] == 'body':
+                    await send({'type': 'http.response.body', 'body': message[1], 'more_body': True})
+                elif message[0] == 'end':
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+                else:
+                    if not started:
+                        await send_status(send, 500, 'Internal Server Error')
+                    break
+            # Raises the worker's exception, if any, for the server to log
+            await worker
+        finally:
+            self.in_flight -= 1
+            IN_FLIGHT.set(self.in_flight)
+
+# The ASGI application for uvicorn, hypercorn or daphne
+application = AsgiApp(app)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, host=os.environ.get('HOUSING_HOST', '127.0.0.1'),
+                port=int(os.environ.get('HOUSING_PORT', 8000)), workers=1)
@@ -0,0 +1,68 @@
+# Benchmarks ChartEngine against the original process_chart_data_request
+#
+# Run from the HousingTrendsApp directory:
+#   python -m benchmarks.bench_chart_engine
+
+# Imports
+import os
+import tempfile
+import timeit
+
+import numpy as np
+from flask import Flask, jsonify
+
+import data_transform_functions as f
+from chart_engine import ChartEngine, COLOR_PALETTE, COLOR_PALETTE2
+from benchmarks.synthetic import write_zillow_csv
+
+# Functions
+def legacy_chart_data(df, selected_cities):
+    '''The chart payload as process_chart_data_request built it before the
+    serving engine: a column selection, list conversions and jsonify.'''
+    filtered_df = df[selected_cities]
+    chart_data = {
+        'labels': list(filtered_df.index),
+        'datasets': []
+    }
+    for i, city in enumerate(filtered_df.columns):
+        dataset = {
+            'label': city,
+            'data': list(filtered_df[city]),
+            'fill': False,
+            'borderColor': COLOR_PALETTE[i % len(COLOR_PALETTE)],
+            'backgroundColor': COLOR_PALETTE2[i % len(COLOR_PALETTE2)],
+            'tension': 0.3,
+            'borderWidth': 3,
+            'pointRadius': 3,
+            'pointHoverRadius': 8
+        }
+        chart_data['datasets'].append(dataset)
+    return jsonify(chart_data).get_data()
+
+def engine_chart_data(app, engine, selected_cities):
+    '''The chart payload as the serving engine builds it.'''
+    return app.response_class(engine.chart_json(engine.resolve(selected_cities)),
+                              mimetype='application/json').get_data()
+
+def main(n_regions=900, n_months=90, repeat=200):
+    with tempfile.TemporaryDirectory() as tmp:
+        house = f.home_price_inventory_transform(
+            write_zillow_csv(os.path.join(tmp, 'metro.csv'), n_regions, n_months))
+
+    app = Flask(__name__)
+    start = timeit.default_timer()
+    engine = ChartEngine(house)
+    build_time = timeit.default_timer() - start
+
+    rng = np.random.default_rng(1)
+    print(f'{n_regions} metros x {n_months} months, engine built in {build_time * 1000:.1f} ms')
+    with app.app_context():
+        for n_cities in (1, 2, 8):
+            cities = list(rng.choice(house.columns, n_cities, replace=False))
+            legacy = timeit.timeit(lambda: legacy_chart_data(house, cities), number=repeat) / repeat
+            fast = timeit.timeit(lambda: engine_chart_data(app, engine, cities), number=repeat) / repeat
+            print(f'{n_cities} cities: legacy {legacy * 1e6:8.1f} us  '
+                  f'engine {fast * 1e6:8.1f} us  speedup {legacy / fast:5.1f}x')
+
+if __name__ == '__main__':
+    main()
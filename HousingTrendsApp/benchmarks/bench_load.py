@@ -0,0 +1,274 @@
+# Load test for the chart API on synthetic Zillow-shaped data
+#
+# Generates price and inventory csv files at the requested size, boots the
+# app (in this process through Flask's test client, or in a child process
+# under a local threaded WSGI server) and replays a seeded, Zipf-distributed
+# city selection workload against /api/pricedata, /api/inventorydata and
+# /api/cities. Throughput, latency percentiles and peak RSS are written as
+# json so runs can be compared over time.
+#
+# Run from the HousingTrendsApp directory:
+#   python -m benchmarks.bench_load --metros 900 --months 300 --requests 5000 \
+#       --concurrency 8 --mode wsgi --output run.json
+
+# Imports
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import numpy as np
+
+from benchmarks.synthetic import zillow_frame
+
+BINARY_MIMETYPE = 'application/vnd.housing-trends.f32'
+
+# Share of requests sent to each endpoint
+ENDPOINT_MIX = {'/api/pricedata': 0.4, '/api/inventorydata': 0.4, '/api/cities': 0.2}
+
+# Time range buttons and how often each is clicked
+RANGE_MIX = {'max': 0.4, '5y': 0.2, '2y': 0.2, '1y': 0.2}
+
+# Csv files of the series the workload requests (see dataset_registry)
+SERIES_FILES = {
+    'price': 'Metro_mlp_uc_sfr_sm_month.csv',
+    'inventory': 'Metro_invt_fs_uc_sfr_sm_month.csv',
+}
+
+# Functions
+def write_data(data_dir, n_metros, n_months, seed):
+    '''Writes the synthetic price and inventory csv files and returns the
+    RegionIDs and names of the metros, most popular (lowest SizeRank)
+    first.'''
+    os.makedirs(data_dir, exist_ok=True)
+    for i, file in enumerate(SERIES_FILES.values()):
+        house = zillow_frame(n_metros, n_months, seed=seed + i)
+        house.to_csv(os.path.join(data_dir, file), index=False)
+    house = house.sort_values('SizeRank')
+    return house['RegionID'].tolist(), house['RegionName'].tolist()
+
+def traffic_plan(region_ids, names, n_requests, seed=0, zipf=1.1, max_cities=8, accept='json'):
+    '''Returns a reproducible list of (endpoint, query string, Accept header)
+    requests. Metros are picked with Zipf probabilities by size rank, the
+    number of metros per chart request is uniform in 1..max_cities and half
+    of the /api/cities requests are searches for the start of a name.'''
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, len(region_ids) + 1) ** zipf
+    weights /= weights.sum()
+    endpoints = rng.choice(list(ENDPOINT_MIX), n_requests, p=list(ENDPOINT_MIX.values()))
+    plan = []
+    for endpoint in endpoints:
+        if endpoint == '/api/cities':
+            if rng.random() < 0.5:
+                plan.append((endpoint, '', 'application/json'))
+            else:
+                name = names[rng.choice(len(names), p=weights)]
+                query = urlencode({'q': name[:rng.integers(2, 6)], 'limit': 20})
+                plan.append((endpoint, query, 'application/json'))
+            continue
+        n_cities = int(rng.integers(1, max_cities + 1))
+        picked = rng.choice(len(region_ids), min(n_cities, len(region_ids)), replace=False, p=weights)
+        params = {
+            'ids': ','.join(str(region_ids[i]) for i in picked),
+            'range': rng.choice(list(RANGE_MIX), p=list(RANGE_MIX.values())),
+        }
+        if rng.random() < 0.5:
+            params['max_points'] = 200
+        if accept == 'mixed':
+            mimetype = BINARY_MIMETYPE if rng.random() < 0.5 else 'application/json'
+        else:
+            mimetype = BINARY_MIMETYPE if accept == 'binary' else 'application/json'
+        plan.append((endpoint, urlencode(params), mimetype))
+    return plan
+
+def percentiles(latencies):
+    '''Summary statistics in milliseconds for a list of latencies in seconds.'''
+    if not latencies:
+        return {}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3),
+            'mean_ms': round(float(ms.mean()), 3), 'max_ms': round(float(ms.max()), 3)}
+
+def max_rss_mb(who):
+    '''Peak resident set size in MB of this process or its waited children.'''
+    usage = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def run_plan(plan, make_sender, concurrency):
+    '''Sends every request of the plan from concurrency worker threads and
+    returns (endpoint, seconds, status, bytes) per request and the wall time.'''
+    results = [None] * len(plan)
+    next_index = iter(range(len(plan)))
+    lock = threading.Lock()
+
+    def worker():
+        send = make_sender()
+        while True:
+            with lock:
+                i = next(next_index, None)
+            if i is None:
+                return
+            endpoint, query, accept = plan[i]
+            start = time.perf_counter()
+            status, size = send(endpoint, query, accept)
+            results[i] = (endpoint, time.perf_counter() - start, status, size)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return results, time.perf_counter() - start
+
+def flask_client_sender(flask_app):
+    '''Returns a factory of per-thread senders using Flask's test client.'''
+    def make():
+        client = flask_app.test_client()
+
+        def send(endpoint, query, accept):
+            response = client.get(f'{endpoint}?{query}' if query else endpoint, headers={'Accept': accept})
+            return response.status_code, len(response.data)
+        return send
+    return make
+
+def http_sender(port):
+    '''Returns a factory of per-thread senders, each keeping one HTTP
+    connection to the server open.'''
+    def make():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+        def send(endpoint, query, accept):
+            nonlocal connection
+            for attempt in range(2):
+                try:
+                    connection.request('GET', f'{endpoint}?{query}' if query else endpoint,
+                                       headers={'Accept': accept})
+                    response = connection.getresponse()
+                    return response.status, len(response.read())
+                except (http.client.HTTPException, OSError):
+                    # The server closed the kept-alive connection
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                    if attempt:
+                        raise
+        return send
+    return make
+
+def app_environment(data_dir):
+    '''Environment variables that point the app at the generated data.'''
+    return dict(os.environ, HOUSING_DATA_DIR=data_dir, HOUSING_WATCH_INTERVAL='0', HOUSING_PRELOAD='')
+
+def serve(port):
+    '''Runs the app under a local threaded WSGI server and prints the bound
+    port on stdout once it is listening.'''
+    from werkzeug.serving import make_server
+    from app import app
+    # Per-request access logs would dominate the timings
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+def summarize(results, wall_time):
+    '''Returns the overall and per endpoint throughput and latency summary.'''
+    def summary(rows, seconds):
+        errors = sum(1 for _, _, status, _ in rows if status >= 400)
+        return dict({
+            'requests': len(rows),
+            'errors': errors,
+            'throughput_rps': round(len(rows) / seconds, 1) if seconds else None,
+            'bytes': sum(size for _, _, _, size in rows),
+        }, **percentiles([latency for _, latency, _, _ in rows]))
+
+    endpoints = {}
+    for row in results:
+        endpoints.setdefault(row[0], []).append(row)
+    return {
+        'overall': summary(results, wall_time),
+        'endpoints': {endpoint: summary(rows, wall_time) for endpoint, rows in sorted(endpoints.items())},
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the chart API on synthetic data.')
+    parser.add_argument('--metros', type=int, default=900)
+    parser.add_argument('--months', type=int, default=300)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--warmup', type=int, default=200, help='requests sent before measuring')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mode', choices=['inprocess', 'wsgi'], default='inprocess')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of metro popularity')
+    parser.add_argument('--max-cities', type=int, default=8)
+    parser.add_argument('--accept', choices=['json', 'binary', 'mixed'], default='json',
+                        help='chart response format requested')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', help='where to write the csv files (default: a temporary directory)')
+    parser.add_argument('--output', help='json file to write the report to (default: stdout)')
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.abspath(args.data_dir or tmp)
+        region_ids, names = write_data(data_dir, args.metros, args.months, args.seed)
+        plan = traffic_plan(region_ids, names, args.warmup + args.requests, args.seed,
+                            args.zipf, args.max_cities, args.accept)
+        warmup, plan = plan[:args.warmup], plan[args.warmup:]
+
+        server = None
+        if args.mode == 'inprocess':
+            os.environ.update(app_environment(data_dir))
+            from app import app
+            make_sender = flask_client_sender(app)
+        else:
+            server = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_load', '--serve', '0'],
+                                      env=app_environment(data_dir), stdout=subprocess.PIPE, text=True)
+            make_sender = http_sender(int(server.stdout.readline()))
+        try:
+            run_plan(warmup, make_sender, args.concurrency)
+            results, wall_time = run_plan(plan, make_sender, args.concurrency)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('serve', 'output')},
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'wall_seconds': round(wall_time, 3),
+        # The server process in wsgi mode; this process (load generator
+        # included) in inprocess mode
+        'peak_rss_mb': max_rss_mb(resource.RUSAGE_SELF if server is None else resource.RUSAGE_CHILDREN),
+    }
+    report.update(summarize(results, wall_time))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# pytest-benchmark suite comparing the original pandas transform with the
+# vectorized home_price_inventory_transform on synthetic Zillow-shaped files
+# at 1x, 10x and 100x the number of metros in the real files.
+#
+# Run from the HousingTrendsApp directory (needs pytest-benchmark):
+#   python -m pytest benchmarks/bench_transforms.py
+# BENCH_BASE_REGIONS changes the 1x size (default 900 metros).
+
+# Imports
+import os
+
+import pandas as pd
+import pytest
+
+import data_transform_functions as f
+from benchmarks.synthetic import write_zillow_csv
+
+BASE_REGIONS = int(os.environ.get('BENCH_BASE_REGIONS', 900))
+N_MONTHS = 90
+SCALES = [1, 10, 100]
+
+# Functions
+def legacy_transform(house_csv):
+    '''home_price_inventory_transform as it was before the rewrite.'''
+    house = pd.read_csv(house_csv)
+    house = house.drop(columns=['RegionID', 'SizeRank', 'RegionType', 'StateName'])
+    house = house.set_index('RegionName').sort_index()
+    house = house.T
+    house.index = pd.to_datetime(house.index, format='%Y-%m-%d')
+    house = house.interpolate(method='quadratic')
+    house = house.fillna(0)
+    return house
+
+@pytest.fixture(scope='session')
+def zillow_csvs(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('zillow')
+    return {
+        scale: write_zillow_csv(str(folder / f'metro_{scale}x.csv'),
+                                BASE_REGIONS * scale, N_MONTHS, seed=scale)
+        for scale in SCALES
+    }
+
+def test_same_output(zillow_csvs):
+    # Values are parsed as float32, so compare to float32 precision
+    pd.testing.assert_frame_equal(legacy_transform(zillow_csvs[1]),
+                                  f.home_price_inventory_transform(zillow_csvs[1]),
+                                  check_freq=False, rtol=1e-6)
+
+@pytest.mark.parametrize('scale', SCALES)
+def test_legacy_transform(benchmark, zillow_csvs, scale):
+    benchmark.group = f'{scale}x regions'
+    benchmark.pedantic(legacy_transform, args=(zillow_csvs[scale],), rounds=3 if scale < 100 else 1)
+
+@pytest.mark.parametrize('scale', SCALES)
+def test_vectorized_transform(benchmark, zillow_csvs, scale):
+    benchmark.group = f'{scale}x regions'
+    benchmark.pedantic(f.home_price_inventory_transform, args=(zillow_csvs[scale],),
+                       rounds=3 if scale < 100 else 1)
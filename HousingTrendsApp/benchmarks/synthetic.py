@@ -0,0 +1,41 @@
+# A file to generate synthetic Zillow-shaped csv files for the benchmarks
+
+# Imports
+import numpy as np
+import pandas as pd
+
+STATES = ['CA', 'TX', 'FL', 'NY', 'PA', 'IL', 'OH', 'GA', 'NC', 'MI', 'WA', 'AZ']
+
+# Functions
+def zillow_frame(n_regions=900, n_months=90, seed=0, gap_rate=0.02, start='2018-03-31'):
+    '''Returns a wide dataframe laid out like a Zillow metro csv: one row per
+    region with RegionID, SizeRank, RegionName, RegionType and StateName
+    followed by one column per month. Values follow a random walk with a
+    sprinkling of missing months and some regions that start late or stop
+    reporting early.'''
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=n_months, freq='ME').strftime('%Y-%m-%d')
+    states = [STATES[i % len(STATES)] for i in range(n_regions)]
+    names = ['United States'] + [f'Metro {i}, {states[i]}' for i in range(1, n_regions)]
+
+    base = rng.uniform(150_000, 900_000, size=(n_regions, 1))
+    steps = rng.normal(0.003, 0.01, size=(n_regions, n_months))
+    values = base * np.exp(np.cumsum(steps, axis=1))
+    values[rng.random(values.shape) < gap_rate] = np.nan
+    late = rng.random(n_regions) < 0.05
+    values[late, :rng.integers(1, max(2, n_months // 4))] = np.nan
+    early = rng.random(n_regions) < 0.02
+    values[early, -rng.integers(1, max(2, n_months // 10)):] = np.nan
+
+    house = pd.DataFrame(values, columns=dates)
+    house.insert(0, 'StateName', [''] + states[1:])
+    house.insert(0, 'RegionType', ['country'] + ['msa'] * (n_regions - 1))
+    house.insert(0, 'RegionName', names)
+    house.insert(0, 'SizeRank', np.arange(n_regions))
+    house.insert(0, 'RegionID', 100_000 + np.arange(n_regions))
+    return house
+
+def write_zillow_csv(path, n_regions=900, n_months=90, seed=0, **kwargs):
+    '''Writes a synthetic Zillow-shaped csv and returns its path.'''
+    zillow_frame(n_regions, n_months, seed, **kwargs).to_csv(path, index=False)
+    return path
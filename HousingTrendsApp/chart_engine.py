@@ -0,0 +1,365 @@
+# A file to store the serving engine that builds the Chart.js json payloads
+
+# Imports
+import json
+import time
+from datetime import datetime, timezone
+from functools import cached_property, lru_cache
+
+import numpy as np
+import pandas as pd
+
+from search_index import CitySearchIndex
+from similarity import TrajectoryIndex
+
+# --- Color Palette for Chart Lines ---
+# A list of colors to cycle through for different cities
+COLOR_PALETTE = [
+    '#FF6385', '#36A2EB', '#FFCE56', '#4BC0C0',
+    '#9966FF', '#FF9F40', '#C9CBCF', '#7CFFB2'
+]
+
+# Transparent versions colors to cycle through for different cities.
+COLOR_PALETTE2 = [
+    "#FF638576", "#36A3EB7A", "#FFCF567D", "#4BC0C07F",
+    "#9966FF7E","#FFA04078", "#C9CBCF7D", "#7CFFB379"
+]
+
+# Time range buttons and the number of years of history each one shows
+TIME_RANGES = {'max': None, '5y': 5, '2y': 2, '1y': 1}
+
+# Everything in a Chart.js dataset except the label and the data array
+DATASET_TEMPLATE = (
+    '{{"label":{label},"regionId":{region_id},"data":{data},"fill":false,"borderColor":"{border}",'
+    '"backgroundColor":"{background}","tension":0.3,"borderWidth":3,'
+    '"pointRadius":3,"pointHoverRadius":8}}'
+)
+
+# Metros whose full-history json data array is kept per engine. Popular
+# metros are requested over and over; the rest are encoded on demand so a
+# worker does not hold a private json copy of the whole matrix.
+DATA_JSON_CACHE = 256
+
+# Range of the int64 RegionID column
+INT64_MIN, INT64_MAX = int(np.iinfo('int64').min), int(np.iinfo('int64').max)
+
+# Content type of the binary chart frames (see binary_frame)
+BINARY_MIMETYPE = 'application/vnd.housing-trends.f32'
+BINARY_MAGIC = b'HTF1'
+
+# Functions
+def binary_frame(header, blocks):
+    '''Returns a binary chart frame: the magic bytes, the byte length of a
+    json header as a little-endian uint32, the header (space padded to a
+    multiple of 4 bytes so the values are float32 aligned) and then the
+    float32 little-endian values of every dataset, in header order.'''
+    header = header.encode()
+    header += b' ' * (-len(header) % 4)
+    return b''.join([BINARY_MAGIC, np.uint32(len(header)).astype('<u4').tobytes(), header, *blocks])
+
+def values_json(values):
+    '''Returns a json array for a 1-d float array, with NaN (a month with no
+    value, e.g. the first year of a year-over-year change) as null.'''
+    values = np.asarray(values, dtype='float64')
+    if not np.isnan(values).any():
+        return json.dumps(values.tolist())
+    return json.dumps([None if value != value else value for value in values.tolist()])
+
+def lttb(y, threshold):
+    '''Largest-Triangle-Three-Buckets downsampling. Returns the indices of
+    `threshold` points of y (evenly spaced x) that preserve the visual shape
+    of the line: the first and last points plus, for each bucket in
+    between, the point forming the largest triangle with its neighbours.'''
+    y = np.nan_to_num(np.asarray(y, dtype='float64'))
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = (hi + next_hi - 1) / 2
+        avg_y = y[hi:next_hi].mean()
+        x = np.arange(lo, hi)
+        areas = np.abs((a - avg_x) * (y[lo:hi] - y[a]) - (a - x) * (avg_y - y[a]))
+        a = lo + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+def series_chunks(engines, positions, windows):
+    '''Yields the payload for several metrics in one response as json text,
+    one dataset at a time. `engines` maps metric name to ChartEngine,
+    `positions` maps it to the selected column positions in that engine and
+    `windows` maps it to the (time_range, start, end, max_points) to use for
+    it.
+
+    Metrics whose selected dates come out the same share one label array:
+    {"labels": [[...], ...],
+     "series": {metric: {"cadence": ..., "labels": i, "datasets": [...]}}}'''
+    # The label arrays go first, so every metric's labels are worked out
+    # before any dataset is serialized
+    labels_index = {}
+    selections = []
+    for metric, engine in engines.items():
+        labels, datasets = engine.select_json(positions[metric], *windows[metric])
+        index = labels_index.setdefault(labels, len(labels_index))
+        selections.append((metric, engine, index, datasets))
+    yield '{"labels":[' + ','.join(labels_index) + '],"series":{'
+    for n, (metric, engine, index, datasets) in enumerate(selections):
+        yield (f'{"," if n else ""}{json.dumps(metric)}:{{"cadence":{json.dumps(engine.cadence)},'
+               f'"labels":{index},"datasets":[')
+        for i, dataset in enumerate(datasets):
+            yield dataset if i == 0 else ',' + dataset
+        yield ']}'
+    yield '}}'
+
+def series_json(engines, positions, windows):
+    '''Returns the payload of series_chunks as a json string.'''
+    return ''.join(series_chunks(engines, positions, windows))
+
+def series_binary(engines, positions, windows):
+    '''Returns the binary frame for several metrics in one response, like
+    series_json: the header is {"series": {metric: <chart header>}} and the
+    value blocks follow in the same order.'''
+    headers, blocks = [], []
+    for metric, engine in engines.items():
+        header, values = engine.select_binary(positions[metric], *windows[metric])
+        headers.append(f'{json.dumps(metric)}:{header}')
+        blocks.append(values)
+    return binary_frame('{"series":{' + ','.join(headers) + '}}', blocks)
+
+# Classes
+class ChartEngine:
+    '''Serves Chart.js payloads for one transformed Zillow series.
+
+    Everything that does not depend on the request is done once up front: a
+    metro name -> column position index, a sorted RegionID array
+    and the json-encoded ISO date labels. The json data arrays of the most
+    recently requested metros are kept in a bounded LRU. A response is then
+    assembled by string concatenation instead of converting Timestamps and
+    numpy scalars to Python objects for jsonify on every call.
+
+    Requests can also ask for a date window (found by binary search on the
+    sorted dates) and a maximum number of points, in which case the series
+    are downsampled with LTTB onto a shared set of dates.'''
+
+    def __init__(self, house, cadence='monthly', zero_is_missing=True):
+        self.cadence = cadence
+        # The base transforms fill missing months with 0; derived series use NaN
+        self.zero_is_missing = zero_is_missing
+        self.version = house.attrs.get('version')
+        self.last_modified = datetime.fromtimestamp(house.attrs.get('built_at') or time.time(),
+                                                    tz=timezone.utc)
+        self.names = [str(name) for name in house.columns]
+        # State, size tier and national rollups (see rollups) follow the metros
+        self.n_rollups = house.attrs.get('rollups') or 0
+        self.n_metros = len(self.names) - self.n_rollups
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        # Zillow SizeRank of each column (None for rollups), for search ranking
+        self.size_ranks = house.attrs.get('size_ranks')
+        self.region_ids = np.asarray(house.attrs.get('region_ids') or [], dtype='int64')
+        if len(self.region_ids) == len(self.names):
+            # Sorted RegionIDs and the column of each, for binary search
+            self.id_order = np.argsort(self.region_ids, kind='stable').astype('int32')
+            self.sorted_ids = self.region_ids[self.id_order]
+            self.ids_json = [str(region_id) for region_id in self.region_ids.tolist()]
+        else:
+            self.sorted_ids = None
+            self.ids_json = ['null'] * len(self.names)
+        self.dates = np.asarray(house.index, dtype='datetime64[D]')
+        self.labels = np.datetime_as_string(self.dates, unit='D').tolist()
+        self.labels_json = json.dumps(self.labels)
+        self.values = np.asarray(house.values, dtype='float64')
+        self.names_json = [json.dumps(name) for name in self.names]
+        self.cities_json = json.dumps(self.names)
+        # Bounded, so mmap mode keeps sharing the data instead of each worker
+        # holding its own json text for every metro
+        self.data_json = lru_cache(maxsize=DATA_JSON_CACHE)(self.column_json)
+
+    def column_json(self, position):
+        '''Returns the json data array of a metro's full history.'''
+        return values_json(self.values[:, position])
+
+    @cached_property
+    def search_index(self):
+        '''Region name search index, built on first use (the registry builds
+        it at load for the series /api/cities searches).'''
+        return CitySearchIndex(self.names, self.size_ranks)
+
+    @cached_property
+    def similarity_index(self):
+        '''Trajectory similarity index over every metro, built on first use.'''
+        return TrajectoryIndex(self.values, zero_is_missing=self.zero_is_missing)
+
+    @cached_property
+    def ranking_order(self):
+        '''Column positions sorted by value for every month, highest first,
+        and the number of metros with a value in each month. Metros without
+        a value that month are at the end of the row. Rollups are not
+        ranked.'''
+        values = self.values[:, :self.n_metros].astype('float64', copy=True)
+        if self.zero_is_missing:
+            values[values == 0] = np.nan
+        # -NaN is still NaN, which argsort puts last
+        order = np.argsort(-values, axis=1, kind='stable').astype('int32')
+        return order, (~np.isnan(values)).sum(axis=1)
+
+    def rankings(self, row, n, ascending=False):
+        '''Returns the column positions of the n highest (or lowest) metros
+        in a month, read from the presorted ranking array.'''
+        order, counts = self.ranking_order
+        ranked = order[row, :counts[row]]
+        return (ranked[::-1] if ascending else ranked)[:n].tolist()
+
+    def resolve(self, cities):
+        '''Returns the column positions of the selected metros. Raises a
+        KeyError naming the first metro that is not in the dataset.'''
+        return [self.positions[city] for city in cities]
+
+    def resolve_ids(self, region_ids):
+        '''Returns the column positions of the selected RegionIDs with one
+        vectorized binary search over the sorted ids. Raises a KeyError
+        naming the first unknown id.'''
+        for region_id in region_ids:
+            # Too large for int64, so certainly not a RegionID
+            if not INT64_MIN <= region_id <= INT64_MAX:
+                raise KeyError(region_id)
+        region_ids = np.asarray(region_ids, dtype='int64')
+        if self.sorted_ids is None:
+            raise KeyError(int(region_ids[0]) if len(region_ids) else None)
+        found = np.searchsorted(self.sorted_ids, region_ids).clip(max=len(self.sorted_ids) - 1)
+        unknown = self.sorted_ids[found] != region_ids
+        if unknown.any():
+            raise KeyError(int(region_ids[np.argmax(unknown)]))
+        return self.id_order[found].tolist()
+
+    def region_id(self, name):
+        '''Returns the RegionID of a metro, or None if it is not known.'''
+        return int(self.region_ids[self.positions[name]]) if self.sorted_ids is not None else None
+
+    def window(self, time_range=None, start=None, end=None):
+        '''Returns the (lo, hi) row bounds for a time range ('max', '5y',
+        '2y' or '1y', counted back from the latest month) and/or explicit
+        start and end dates. Raises a ValueError for an unknown range.'''
+        lo, hi = 0, len(self.dates)
+        if time_range is not None:
+            if time_range not in TIME_RANGES:
+                raise ValueError(f"Unknown range '{time_range}'")
+            years = TIME_RANGES[time_range]
+            if years is not None and hi > 0:
+                first = pd.Timestamp(self.dates[-1]) - pd.DateOffset(years=years)
+                lo = int(np.searchsorted(self.dates, np.datetime64(first.date()), side='left'))
+        if start is not None:
+            lo = max(lo, int(np.searchsorted(self.dates, np.datetime64(start, 'D'), side='left')))
+        if end is not None:
+            hi = min(hi, int(np.searchsorted(self.dates, np.datetime64(end, 'D'), side='right')))
+        return lo, max(lo, hi)
+
+    def sample_rows(self, positions, lo, hi, max_points=None):
+        '''Returns the rows to send for the window, or None for all of them.
+        When the window is longer than max_points each series is downsampled
+        with LTTB on its share of the budget and the union of the picked rows
+        is used, so all datasets keep one shared label array. The union is
+        thinned evenly (keeping the first and last rows) when it comes out
+        longer than max_points.'''
+        if not max_points or hi - lo <= max_points:
+            return None
+        budget = max(3, max_points // max(1, len(positions)))
+        rows = set()
+        for position in positions:
+            rows.update(lttb(self.values[lo:hi, position], budget).tolist())
+        rows = np.array(sorted(rows))
+        if len(rows) > max_points:
+            rows = rows[np.linspace(0, len(rows) - 1, max_points).round().astype(int)]
+        return lo + rows
+
+    def select_json(self, positions, time_range=None, start=None, end=None, max_points=None):
+        '''Returns the json-encoded label array and an iterator over the
+        json-encoded Chart.js datasets for the metros at the given column
+        positions, limited to the requested window and number of points.
+        The datasets are serialized one at a time as the iterator is
+        consumed, so a response can be streamed while it is being built.'''
+        lo, hi = self.window(time_range, start, end)
+        rows = self.sample_rows(positions, lo, hi, max_points)
+        full = rows is None and (lo, hi) == (0, len(self.dates))
+
+        if full:
+            labels = self.labels_json
+        elif rows is None:
+            labels = json.dumps(self.labels[lo:hi])
+        else:
+            labels = json.dumps([self.labels[row] for row in rows])
+
+        def datasets():
+            for i, position in enumerate(positions):
+                if full:
+                    data = self.data_json(position)
+                elif rows is None:
+                    data = values_json(self.values[lo:hi, position])
+                else:
+                    data = values_json(self.values[rows, position])
+                yield DATASET_TEMPLATE.format(
+                    label=self.names_json[position],
+                    region_id=self.ids_json[position],
+                    data=data,
+                    border=COLOR_PALETTE[i % len(COLOR_PALETTE)],
+                    background=COLOR_PALETTE2[i % len(COLOR_PALETTE2)],
+                )
+        return labels, datasets()
+
+    def select_binary(self, positions, time_range=None, start=None, end=None, max_points=None):
+        '''Returns the json header and float32 values of a binary chart
+        frame for the metros at the given column positions. Instead of a
+        label list the header has the first date, the cadence and, when the
+        window was downsampled, the offset of each point from the first
+        date; the datasets have "data": null and their values follow the
+        header.'''
+        lo, hi = self.window(time_range, start, end)
+        rows = self.sample_rows(positions, lo, hi, max_points)
+        if rows is None:
+            block = self.values[lo:hi, positions]
+            offsets = 'null'
+        else:
+            block = self.values[np.ix_(rows, positions)]
+            offsets = json.dumps((rows - lo).tolist())
+        header = (f'{{"cadence":{json.dumps(self.cadence)},'
+                  f'"start":{json.dumps(self.labels[lo] if hi > lo else None)},'
+                  f'"points":{len(block)},"offsets":{offsets},"datasets":[')
+        datasets = [
+            DATASET_TEMPLATE.format(
+                label=self.names_json[position],
+                region_id=self.ids_json[position],
+                data='null',
+                border=COLOR_PALETTE[i % len(COLOR_PALETTE)],
+                background=COLOR_PALETTE2[i % len(COLOR_PALETTE2)],
+            )
+            for i, position in enumerate(positions)
+        ]
+        # Dataset-major, so each dataset's values are one contiguous run
+        values = np.ascontiguousarray(block.T, dtype='<f4')
+        return header + ','.join(datasets) + ']}', values.tobytes()
+
+    def chart_binary(self, positions, time_range=None, start=None, end=None, max_points=None):
+        '''Returns the binary chart frame for the metros at the given column
+        positions.'''
+        header, values = self.select_binary(positions, time_range, start, end, max_points)
+        return binary_frame(header, [values])
+
+    def chart_chunks(self, positions, time_range=None, start=None, end=None, max_points=None):
+        '''Yields the Chart.js payload for the metros at the given column
+        positions as json text, one dataset at a time.'''
+        labels, datasets = self.select_json(positions, time_range, start, end, max_points)
+        yield '{"labels":' + labels + ',"datasets":['
+        for i, dataset in enumerate(datasets):
+            yield dataset if i == 0 else ',' + dataset
+        yield ']}'
+
+    def chart_json(self, positions, time_range=None, start=None, end=None, max_points=None):
+        '''Returns the Chart.js payload for the metros at the given column
+        positions as a json string.'''
+        return ''.join(self.chart_chunks(positions, time_range, start, end, max_points))
+
@@ -0,0 +1,56 @@
+# A file to store the gzip and brotli compression of api responses
+
+# Imports
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; without it responses are only gzipped
+    brotli = None
+
+# Compression settings. Bodies are compressed once per dataset version and
+# then served from the response cache, so these lean towards smaller bodies
+# over speed, but stay low enough to stream a cache miss without stalling.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Encodings the server can produce, preferred first on equal quality
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# Functions
+def negotiate(accept_encodings, encodings=ENCODINGS):
+    '''Returns the encoding to compress a response with for the client's
+    Accept-Encoding header (a werkzeug Accept), or None to send it as is.'''
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(body, encoding):
+    '''Returns body (bytes) compressed in one go.'''
+    compressor = Compressor(encoding)
+    return compressor.compress(body) + compressor.flush()
+
+# Classes
+class Compressor:
+    '''Compresses a body that arrives in chunks, for streamed responses.
+    compress() returns whatever compressed bytes are ready (possibly none)
+    and flush() the rest once the body is complete.'''
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            if brotli is None:
+                raise ValueError("Brotli compression needs the brotli package")
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress = self.compressor.process
+            self.flush = self.compressor.finish
+        elif encoding == 'gzip':
+            # wbits 16 + 15 writes a gzip header and trailer around deflate
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress = self.compressor.compress
+            self.flush = self.compressor.flush
+        else:
+            raise ValueError(f"Unknown encoding '{encoding}'")
@@ -0,0 +1,236 @@
+# A file to store functions that cache the transformed Zillow data on disk
+
+# Imports
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import data_transform_functions as f
+import metrics
+from derived_metrics import DERIVED_METRICS
+from rollups import add_rollups
+
+# Bump this whenever the on-disk layout or the transform output changes so
+# that old cache entries are rebuilt instead of being read back.
+CACHE_VERSION = 5
+CACHE_DIR = os.path.join('data', 'cache')
+
+# Functions
+def source_key(house_csv, transform, params=None):
+    '''Returns a hash of the source csv contents, the transform and its
+    parameters. Any change to one of them produces a new cache entry.'''
+    digest = hashlib.sha256()
+    digest.update(f'v{CACHE_VERSION}:{transform.__module__}.{transform.__name__}:'.encode())
+    digest.update(json.dumps(params or {}, sort_keys=True).encode())
+    with open(house_csv, 'rb') as csv_file:
+        for chunk in iter(lambda: csv_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def entry_dir(house_csv, key, cache_dir=CACHE_DIR):
+    '''Returns the cache directory for one version of a source csv.'''
+    stem = os.path.splitext(os.path.basename(house_csv))[0]
+    return os.path.join(cache_dir, f'{stem}-{key[:16]}')
+
+def derived_file(suffix):
+    '''Returns the file name of a derived metric's matrix in a cache entry.'''
+    return f'derived-{suffix}.npy'
+
+def save_frame(house, path, key):
+    '''Writes a transformed dataframe as a .npy value matrix plus a json
+    index of the metro names and dates. The derived metrics (see
+    derived_metrics) of every column are computed here and stored next to
+    it, so workers load or map them like the base series. The entry is
+    written to a temporary directory first and renamed into place so
+    readers never see half of it.'''
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        values = house.to_numpy(dtype='float64')
+        # Column-major so each metro's history is one contiguous run of pages
+        np.save(os.path.join(tmp_path, 'values.npy'), np.asfortranarray(values))
+        for suffix, (_, _, function) in DERIVED_METRICS.items():
+            np.save(os.path.join(tmp_path, derived_file(suffix)), np.asfortranarray(function(values)))
+        meta = {
+            'cache_version': CACHE_VERSION,
+            'key': key,
+            'built_at': time.time(),
+            'metros': [str(name) for name in house.columns],
+            'dates': [date.strftime('%Y-%m-%d') for date in house.index],
+            'region_ids': house.attrs.get('region_ids'),
+            'states': house.attrs.get('states'),
+            'size_ranks': house.attrs.get('size_ranks'),
+            # Number of state/tier/national rollup columns after the metros
+            'rollups': house.attrs.get('rollups', 0),
+            'derived': list(DERIVED_METRICS),
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another worker published the same entry first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+def read_meta(path):
+    '''Reads the json index of a cache entry, or None if it is missing.'''
+    try:
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+
+def entry_valid(meta, key):
+    '''Whether a cache entry's json index is complete and was built for key
+    by the current cache layout.'''
+    return meta is not None and meta.get('cache_version') == CACHE_VERSION and meta.get('key') == key
+
+def discard_entry(path):
+    '''Removes a stale cache entry. It is renamed out of the way first, so
+    a new entry can be published at path while the old files are deleted.'''
+    trash = tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.stale-')
+    try:
+        os.rename(path, os.path.join(trash, 'entry'))
+    except FileNotFoundError:
+        pass
+    shutil.rmtree(trash, ignore_errors=True)
+
+def entry_attrs(meta, derive=None):
+    '''Returns the frame attrs stored in a cache entry's json index, for the
+    base series or one of its derived metrics.'''
+    return {
+        'version': meta['key'] if derive is None else f"{meta['key']}:{derive}",
+        'built_at': meta.get('built_at'),
+        'region_ids': meta.get('region_ids'),
+        'states': meta.get('states'),
+        'size_ranks': meta.get('size_ranks'),
+        'rollups': meta.get('rollups', 0),
+    }
+
+def values_path(path, derive=None):
+    '''Returns the matrix file of a cache entry's base series or of one of
+    its derived metrics.'''
+    return os.path.join(path, 'values.npy' if derive is None else derived_file(derive))
+
+def load_frame(path, mmap_mode=None, derive=None):
+    '''Loads a cache entry (or, with derive, one of its derived metrics)
+    back into a dataframe with metros as columns and months as the index.'''
+    meta = read_meta(path)
+    values = np.load(values_path(path, derive), mmap_mode=mmap_mode)
+    house = pd.DataFrame(values, index=pd.to_datetime(meta['dates'], format='%Y-%m-%d'),
+                         columns=pd.Index(meta['metros'], name='RegionName'))
+    house.attrs.update(entry_attrs(meta, derive))
+    return house
+
+class MappedSeries:
+    '''A read-only view of a cache entry backed by a memory-mapped value
+    matrix. Every worker process that maps the same entry shares the same
+    pages through the OS page cache instead of holding a private copy.
+
+    Has the part of the dataframe interface ChartEngine reads: `values`,
+    `columns`, `index` and `attrs`.'''
+
+    def __init__(self, path, derive=None):
+        meta = read_meta(path)
+        self.values = np.load(values_path(path, derive), mmap_mode='r')
+        self.columns = pd.Index(meta['metros'], name='RegionName')
+        self.index = pd.to_datetime(meta['dates'], format='%Y-%m-%d')
+        self.attrs = entry_attrs(meta, derive)
+
+def prune_stale(house_csv, keep, cache_dir=CACHE_DIR):
+    '''Removes cache entries for older versions of the same source csv.'''
+    if not os.path.isdir(cache_dir):
+        return
+    stem = os.path.splitext(os.path.basename(house_csv))[0]
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.rsplit('-', 1)[0] == stem and path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+def entries(house_csv, cache_dir=CACHE_DIR):
+    '''Returns the paths of the current-format cache entries for a source
+    csv, newest first.'''
+    if not os.path.isdir(cache_dir):
+        return []
+    stem = os.path.splitext(os.path.basename(house_csv))[0]
+    found = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        meta = read_meta(path) if name.rsplit('-', 1)[0] == stem else None
+        if meta is not None and meta.get('cache_version') == CACHE_VERSION:
+            found.append((meta.get('built_at') or 0, path))
+    return [path for _, path in sorted(found, reverse=True)]
+
+def publish(house_csv, path, cache_dir=CACHE_DIR, ingest=None):
+    '''Records path as the current version of a source csv in the cache's
+    published.json, with the ingest's {'mode', 'seconds'} when given,
+    replacing the file atomically so a running server watching it never
+    reads a partial write.'''
+    published = read_published(cache_dir)
+    stem = os.path.splitext(os.path.basename(house_csv))[0]
+    published[stem] = {'entry': os.path.basename(path), 'key': read_meta(path)['key']}
+    if ingest is not None:
+        published[stem]['ingest'] = ingest
+    handle, tmp_file = tempfile.mkstemp(dir=cache_dir, prefix='.tmp-', suffix='.json')
+    with os.fdopen(handle, 'w') as published_file:
+        json.dump(published, published_file)
+    os.replace(tmp_file, os.path.join(cache_dir, 'published.json'))
+
+def read_published(cache_dir=CACHE_DIR):
+    '''Returns the published versions, {csv stem: {'entry', 'key'}}, plus
+    'ingest' for entries published by ingest.py.'''
+    try:
+        with open(os.path.join(cache_dir, 'published.json')) as published_file:
+            return json.load(published_file)
+    except (OSError, ValueError):
+        return {}
+
+def cached_transform(house_csv, transform=f.home_price_inventory_transform,
+                     cache_dir=CACHE_DIR, mode='memory', **params):
+    '''Returns the transformed dataframe for a Zillow csv, reading it from the
+    on-disk cache when the csv and transform are unchanged and rebuilding
+    (and replacing the stale entry) otherwise.
+
+    With mode='mmap' a read-only MappedSeries over the cache entry is
+    returned instead of a private in-memory dataframe.'''
+    if mode not in ('memory', 'mmap'):
+        raise ValueError(f"Unknown cache mode '{mode}'")
+    start = time.perf_counter()
+    key = source_key(house_csv, transform, params)
+    path = entry_dir(house_csv, key, cache_dir)
+    source = 'cache'
+    if not entry_valid(read_meta(path), key):
+        source = 'transform'
+        # Rollups are computed once per version and stored with the metros
+        house = add_rollups(transform(house_csv, **params))
+        # Workers starting together all transform a new csv; only replace
+        # the entry if no other worker has published it in the meantime
+        if not entry_valid(read_meta(path), key):
+            if os.path.isdir(path):
+                discard_entry(path)
+            save_frame(house, path, key)
+        prune_stale(house_csv, path, cache_dir)
+    house = MappedSeries(path) if mode == 'mmap' else load_frame(path)
+    metrics.TRANSFORM_SECONDS.observe(time.perf_counter() - start, source=source)
+    return house
+
+def cached_derived(house_csv, version, derive, cache_dir=CACHE_DIR, mode='memory'):
+    '''Returns a derived metric stored in the cache entry of a csv's base
+    series version (a source_key), or None when that entry or its derived
+    matrix is not in the cache. With mode='mmap' a MappedSeries is returned.'''
+    path = entry_dir(house_csv, version, cache_dir)
+    meta = read_meta(path)
+    if not entry_valid(meta, version) or derive not in meta.get('derived', []):
+        return None
+    try:
+        return MappedSeries(path, derive) if mode == 'mmap' else load_frame(path, derive=derive)
+    except OSError:
+        # The entry was replaced while it was being read
+        return None
@@ -1,19 +1,103 @@
 # A file to store functions that transform the Zillow data
 
 # Imports
+import numpy as np
 import pandas as pd
+from scipy.interpolate import make_interp_spline
+
+# Region metadata columns at the front of every Zillow metro csv
+META_COLUMNS = ['RegionID', 'SizeRank', 'RegionName', 'RegionType', 'StateName']
 
 # Functions
+def read_zillow_header(house_csv):
+    '''Returns the column names of a Zillow csv without reading any rows.'''
+    return list(pd.read_csv(house_csv, nrows=0).columns)
+
+def read_zillow_csv(house_csv, meta_columns=('RegionName',), date_columns=None, chunksize=50_000):
+    '''Reads a Zillow metro csv into the requested metadata columns, the
+    parsed month dates and a float32 regions x months value matrix. The
+    header is read once to find the date columns, only the needed columns
+    are parsed, and rows are read in chunks to bound the parser's memory.
+    Pass date_columns to read only some of the months.'''
+    header = read_zillow_header(house_csv)
+    if date_columns is None:
+        date_columns = [column for column in header if column not in META_COLUMNS]
+    else:
+        date_columns = [column for column in date_columns if column in header]
+    dates = pd.to_datetime(date_columns, format='%Y-%m-%d')
+    meta_columns = [column for column in meta_columns if column in header]
+
+    metas, blocks = [], []
+    chunks = pd.read_csv(house_csv, usecols=meta_columns + date_columns,
+                         dtype={column: 'float32' for column in date_columns},
+                         chunksize=chunksize)
+    for chunk in chunks:
+        metas.append(chunk[meta_columns])
+        blocks.append(chunk[date_columns].to_numpy(dtype='float32'))
+    meta = pd.concat(metas, ignore_index=True)
+    values = np.concatenate(blocks) if blocks else np.empty((0, len(date_columns)), dtype='float32')
+    return meta, dates, values
+
+def interpolate_quadratic(values, dates):
+    '''Fills the gaps in a months x regions matrix with a quadratic spline
+    through each column's valid points, like pandas' interpolate(method=
+    'quadratic'): gaps between valid points are filled, leading and trailing
+    gaps are left as NaN. Columns with the same missing months are fitted
+    together in one scipy spline call instead of one call per column.'''
+    values = np.array(values, dtype='float64')
+    missing = np.isnan(values)
+    # Only gaps with a valid month on both sides get filled, so columns that
+    # are just missing at the start or end need no fit at all
+    seen = np.maximum.accumulate(~missing, axis=0)
+    to_come = np.maximum.accumulate(~missing[::-1], axis=0)[::-1]
+    gappy = np.flatnonzero((missing & seen & to_come).any(axis=0))
+    if len(gappy) == 0:
+        return values
+    x = dates.asi8.astype('float64')
+
+    # Group the columns by their pattern of missing months
+    patterns = np.packbits(missing[:, gappy], axis=0).T
+    groups = {}
+    for column, pattern in zip(gappy, patterns):
+        groups.setdefault(pattern.tobytes(), []).append(column)
+
+    for columns in groups.values():
+        invalid = missing[:, columns[0]]
+        valid = ~invalid
+        if valid.sum() < 3:
+            # Not enough points for a quadratic fit
+            continue
+        fit = make_interp_spline(x[valid], values[np.ix_(valid, columns)], k=2, axis=0)
+        # Evaluate only inside the valid range; outside it stays NaN
+        inside = invalid & (x > x[valid][0]) & (x < x[valid][-1])
+        values[np.ix_(inside, columns)] = fit(x[inside])
+    return values
+
+def region_metadata(meta):
+    '''Returns the StateName and SizeRank columns of a region metadata frame
+    as json-friendly lists (None where missing), keyed like the frame attrs.'''
+    def column(name):
+        if name not in meta:
+            return None
+        return [None if pd.isna(value) else value for value in meta[name].tolist()]
+    size_ranks = column('SizeRank')
+    return {
+        'states': column('StateName'),
+        'size_ranks': None if size_ranks is None else [None if rank is None else int(rank) for rank in size_ranks],
+    }
+
 def home_price_inventory_transform(house_csv):
     '''Transforms the the Zillow Home Value Index dataframe into a format
     that can be used for a timeseries line graph in json format for chartjs'''
-    house = pd.read_csv(house_csv)
-    house = house.drop(columns=['RegionID', 'SizeRank', 'RegionType', 'StateName'])
-    house = house.set_index('RegionName').sort_index()
-    house = house.T
-    house.index = pd.to_datetime(house.index, format='%Y-%m-%d')
-    house = house.interpolate(method='quadratic')
-    house = house.fillna(0)
+    meta, dates, values = read_zillow_csv(house_csv, meta_columns=('RegionID', 'SizeRank', 'RegionName', 'StateName'))
+    order = np.argsort(meta['RegionName'].to_numpy(dtype=str), kind='stable')
+    values = interpolate_quadratic(values[order].T, dates)
+    house = pd.DataFrame(np.nan_to_num(values, nan=0.0), index=dates,
+                         columns=pd.Index(meta['RegionName'].to_numpy()[order], name='RegionName'))
+    # Kept for incremental ingest, which matches regions across drops by id
+    house.attrs['region_ids'] = meta['RegionID'].to_numpy()[order].tolist()
+    # Kept for the state and size tier rollups
+    house.attrs.update(region_metadata(meta.iloc[order]))
     return house
 
 def home_rent_transform(house):
@@ -0,0 +1,243 @@
+# A file to declare the Zillow series the app can serve and load them lazily
+
+# Imports
+import logging
+import os
+import threading
+import time
+
+import data_transform_functions as f
+import data_cache as dc
+import metrics
+from chart_engine import ChartEngine
+from derived_metrics import DERIVED_METRICS, derived_frame
+
+logger = logging.getLogger(__name__)
+
+# Classes
+class SeriesSpec:
+    '''Declares one Zillow series: the csv it comes from, the transform that
+    turns it into a dates x metros frame, and how to label it.'''
+
+    def __init__(self, name, file, transform=f.home_price_inventory_transform,
+                 title='', units='', cadence='monthly', base=None, derive=None, searchable=False):
+        self.name = name
+        self.file = file
+        self.transform = transform
+        self.title = title
+        self.units = units
+        self.cadence = cadence
+        # Derived series: the base series name and the DERIVED_METRICS key
+        self.base = base
+        self.derive = derive
+        # Whether /api/cities searches this series' names, so its search
+        # index is built when it loads rather than on the first query
+        self.searchable = searchable
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'title': self.title,
+            'units': self.units,
+            'cadence': self.cadence,
+            'base': self.base,
+        }
+
+def derived_spec(spec, suffix):
+    '''Declares a derived metric (see derived_metrics) of a base series.'''
+    title, units, _ = DERIVED_METRICS[suffix]
+    return SeriesSpec(f'{spec.name}_{suffix}', spec.file, spec.transform,
+                      title=f'{spec.title} {title}', units=units or spec.units,
+                      cadence=spec.cadence, base=spec.name, derive=suffix)
+
+# Every Zillow series the app knows about. Nothing is read until a series is
+# first requested (or preloaded), so registering a series is free.
+SERIES = [
+    SeriesSpec('price', 'Metro_mlp_uc_sfr_sm_month.csv',
+               title='Median List Price (Single Family Homes)', units='USD', searchable=True),
+    SeriesSpec('inventory', 'Metro_invt_fs_uc_sfr_sm_month.csv',
+               title='For Sale Inventory (Single Family Homes)', units='homes'),
+    SeriesSpec('zhvi', 'Metro_zhvi_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv',
+               title='Zillow Home Value Index (All Homes)', units='USD'),
+    SeriesSpec('sale_price', 'Metro_median_sale_price_uc_sfrcondo_sm_sa_month.csv',
+               title='Median Sale Price (All Homes)', units='USD'),
+    SeriesSpec('days_to_pending', 'Metro_mean_doz_pending_uc_sfrcondo_sm_month.csv',
+               title='Mean Days to Pending Sale', units='days'),
+    SeriesSpec('price_cuts', 'Metro_perc_listings_price_cut_uc_sfrcondo_sm_month.csv',
+               title='Share of Listings with a Price Cut', units='percent'),
+    SeriesSpec('below_list', 'Metro_pct_sold_below_list_uc_sfrcondo_sm_month.csv',
+               title='Percent of Homes Sold Below List Price', units='percent'),
+    SeriesSpec('rent', 'Metro_zori_uc_sfrcondomfr_sm_month.csv',
+               title='Zillow Observed Rent Index (All Homes)', units='USD'),
+    SeriesSpec('zhvi_sfh', 'Metro_zhvi_uc_sfr_tier_0.33_0.67_sm_sa_month.csv',
+               title='Zillow Home Value Index (Single Family Homes)', units='USD'),
+    SeriesSpec('zhvi_condo', 'Metro_zhvi_uc_condo_tier_0.33_0.67_sm_sa_month.csv',
+               title='Zillow Home Value Index (Condos)', units='USD'),
+] + [
+    SeriesSpec(f'zhvi_{beds}bdr', f'Metro_zhvi_bdrmcnt_{beds}_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv',
+               title=f'Zillow Home Value Index ({beds} Bedroom{"s" if beds > 1 else ""})', units='USD')
+    for beds in range(1, 6)
+]
+
+# Year-over-year and month-over-month change and 3 and 12 month averages of
+# every series, e.g. 'price_yoy'. They are computed for all metros at once
+# when the base series is transformed or ingested and stored in its cache
+# entry; their per-month rankings are presorted when they load.
+SERIES += [derived_spec(spec, suffix) for spec in SERIES for suffix in DERIVED_METRICS]
+
+class DatasetRegistry:
+    '''Loads the declared series on first access and keeps them for the life
+    of the registry. Each series has its own lock, so loading a rarely used
+    series never blocks requests for one that is already loaded.'''
+
+    def __init__(self, specs=SERIES, data_dir='data', mode='memory', cache_dir=None, previous=None):
+        self.previous = previous
+        self.specs = {spec.name: spec for spec in specs}
+        self.data_dir = data_dir
+        self.mode = mode
+        self.cache_dir = cache_dir or os.path.join(data_dir, 'cache')
+        self.engines = {}
+        self.load_times = {}
+        self.locks = {name: threading.Lock() for name in self.specs}
+
+    def __contains__(self, name):
+        return name in self.specs
+
+    def path(self, name):
+        '''Returns the path of the csv a series is read from.'''
+        return os.path.join(self.data_dir, self.specs[name].file)
+
+    def is_loaded(self, name):
+        return name in self.engines
+
+    def get(self, name):
+        '''Returns the ChartEngine for a series, loading it on first access.
+        Raises a KeyError for an unregistered series and a FileNotFoundError
+        when its csv is missing.'''
+        engine = self.engines.get(name)
+        if engine is not None:
+            return engine
+        spec = self.specs[name]
+        with self.locks[name]:
+            # Another thread may have finished loading while we waited
+            if name not in self.engines:
+                start = time.perf_counter()
+                old = self.previous.engines.get(name) if self.previous is not None else None
+                if spec.base is not None:
+                    base = self.get(spec.base)
+                    version = f'{base.version}:{spec.derive}'
+                elif old is not None:
+                    version = dc.source_key(self.path(name), spec.transform)
+                else:
+                    version = None
+                if old is not None and old.version == version:
+                    # Unchanged since the previous snapshot, so share its engine
+                    self.engines[name] = old
+                elif spec.base is not None:
+                    # Stored with the base series in its cache entry; computed
+                    # here only if the entry has none (e.g. it was just pruned)
+                    house = dc.cached_derived(self.path(name), base.version, spec.derive,
+                                              cache_dir=self.cache_dir, mode=self.mode)
+                    if house is None:
+                        house = derived_frame(base, spec.derive)
+                    engine = ChartEngine(house, cadence=spec.cadence, zero_is_missing=False)
+                    # Presort the per-month rankings now, not on the first request
+                    engine.ranking_order
+                    self.engines[name] = engine
+                else:
+                    house = dc.cached_transform(self.path(name), spec.transform,
+                                                cache_dir=self.cache_dir, mode=self.mode)
+                    engine = ChartEngine(house, cadence=spec.cadence)
+                    if spec.searchable:
+                        # Built before the engine is published (and, on a
+                        # reload, before the new snapshot is swapped in)
+                        engine.search_index
+                    self.engines[name] = engine
+                self.load_times[name] = time.perf_counter() - start
+                metrics.DATASET_LOAD_SECONDS.observe(self.load_times[name], series=name)
+        return self.engines[name]
+
+    def preload(self, names=None, background=False):
+        '''Loads the given series (all of them by default) now instead of on
+        first access. Series whose csv is missing are skipped. With
+        background=True the loading runs in a daemon thread, which is
+        returned.'''
+        names = list(self.specs) if names is None else names
+
+        def load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except FileNotFoundError:
+                    pass
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name='dataset-preload', daemon=True)
+        thread.start()
+        return thread
+
+    def describe(self):
+        '''Returns the registered series with their load state and load time
+        in seconds.'''
+        return [
+            dict(spec.describe(), loaded=self.is_loaded(name),
+                 load_seconds=self.load_times.get(name))
+            for name, spec in self.specs.items()
+        ]
+
+class DatasetHolder:
+    '''Holds the current DatasetRegistry snapshot and swaps in a new one on
+    reload. Requests read `current` once and use that snapshot until they
+    finish; the swap is a single reference assignment, so the read path
+    takes no locks. Responses cached under the old data stop matching as
+    soon as the dataset versions change.'''
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.current = factory(previous=None)
+        self.generation = 1
+        self.reload_lock = threading.Lock()
+        self.watched_mtime = None
+
+    def reload(self):
+        '''Builds a new snapshot, loads every series the current one has
+        loaded (reusing unchanged ones) and then swaps it in, so no request
+        waits on the new data. Returns the new generation number.'''
+        with self.reload_lock:
+            old = self.current
+            new = self.factory(previous=old)
+            new.preload([name for name in old.specs if old.is_loaded(name)])
+            new.previous = None
+            self.current = new
+            self.generation += 1
+            return self.generation
+
+    def watch(self, path, interval=10.0):
+        '''Polls the modification time of path (the cache's published.json)
+        in a daemon thread and reloads when it changes. A failed reload is
+        logged and retried on the next poll. Returns the thread.'''
+        def mtime():
+            try:
+                return os.stat(path).st_mtime_ns
+            except OSError:
+                return None
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                current = mtime()
+                if current != self.watched_mtime:
+                    try:
+                        self.reload()
+                    except Exception:
+                        # Left unrecorded so the next poll tries again
+                        logger.exception('Dataset reload failed')
+                    else:
+                        self.watched_mtime = current
+
+        self.watched_mtime = mtime()
+        thread = threading.Thread(target=poll, name='dataset-watch', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,62 @@
+# A file to store the derived metrics computed from the transformed series
+
+# Imports
+import numpy as np
+import pandas as pd
+
+# Functions
+def as_missing(values):
+    '''Returns a float copy of a transformed matrix with the 0 fill values
+    (months with no data) as NaN.'''
+    values = np.array(values, dtype='float64')
+    values[values == 0] = np.nan
+    return values
+
+def pct_change(values, lag):
+    '''Percent change over lag months for every metro at once. NaN where
+    either month has no data.'''
+    values = as_missing(values)
+    change = np.full_like(values, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change[lag:] = (values[lag:] / values[:-lag] - 1) * 100
+    return change
+
+def rolling_mean(values, window):
+    '''Trailing mean over window months for every metro at once, using
+    cumulative sums. NaN until a metro has window months of data in a row.'''
+    values = as_missing(values)
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0), axis=0)
+    counts = np.cumsum(valid, axis=0)
+    means = np.full_like(values, np.nan)
+    if len(values) >= window:
+        window_sums = sums[window - 1:].copy()
+        window_sums[1:] -= sums[:-window]
+        window_counts = counts[window - 1:].copy()
+        window_counts[1:] -= counts[:-window]
+        with np.errstate(invalid='ignore'):
+            means[window - 1:] = np.where(window_counts == window, window_sums / window, np.nan)
+    return means
+
+# Derived metrics available for every base series: name suffix, title
+# suffix, units (None keeps the base series' units) and the function
+DERIVED_METRICS = {
+    'yoy': ('Year-over-Year Change', 'percent', lambda values: pct_change(values, 12)),
+    'mom': ('Month-over-Month Change', 'percent', lambda values: pct_change(values, 1)),
+    'avg3': ('3-Month Average', None, lambda values: rolling_mean(values, 3)),
+    'avg12': ('12-Month Average', None, lambda values: rolling_mean(values, 12)),
+}
+
+def derived_frame(engine, suffix):
+    '''Computes a derived metric for every metro of a base ChartEngine and
+    returns it as a dataframe carrying the base series' metadata, with a
+    version derived from the base version.'''
+    _, _, function = DERIVED_METRICS[suffix]
+    house = pd.DataFrame(function(engine.values), index=pd.DatetimeIndex(engine.dates),
+                         columns=pd.Index(engine.names, name='RegionName'))
+    house.attrs['version'] = f'{engine.version}:{suffix}'
+    house.attrs['built_at'] = engine.last_modified.timestamp()
+    house.attrs['rollups'] = engine.n_rollups
+    if engine.sorted_ids is not None:
+        house.attrs['region_ids'] = engine.region_ids.tolist()
+    return house
@@ -0,0 +1,206 @@
+# Incrementally ingests a new monthly Zillow drop into the on-disk cache
+#
+# Usage, from the HousingTrendsApp directory:
+#   python ingest.py data/Metro_mlp_uc_sfr_sm_month.csv [--window 12]
+#   python ingest.py --series price inventory
+#   python ingest.py --series all --workers 8
+
+# Imports
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import data_transform_functions as f
+import data_cache as dc
+import metrics
+from rollups import add_rollups
+
+# Months before the end of the persisted history that are re-interpolated,
+# and months before those used to anchor the quadratic fit
+WINDOW = 12
+
+# Functions
+def full_ingest(house_csv, cache_dir=dc.CACHE_DIR):
+    '''Transforms the whole csv and returns its entry path.'''
+    dc.cached_transform(house_csv, f.home_price_inventory_transform, cache_dir=cache_dir)
+    key = dc.source_key(house_csv, f.home_price_inventory_transform, {})
+    return dc.entry_dir(house_csv, key, cache_dir)
+
+def incremental_values(house_csv, meta, old_values, window):
+    '''Returns the updated metros frame (with its region metadata in attrs)
+    for a new drop of a csv whose previous version is described by meta and
+    old_values, reading only the months that changed. The old rollup
+    columns are dropped; they are recomputed from the updated metros.'''
+    header = f.read_zillow_header(house_csv)
+    n_metros = len(meta['metros']) - meta.get('rollups', 0)
+    old_ids = meta['region_ids'][:n_metros]
+    old_values = old_values[:, :n_metros]
+    old_dates = meta['dates']
+    csv_dates = [column for column in header if column not in f.META_COLUMNS]
+    new_dates = csv_dates[len(old_dates):]
+    n_old, n_new = len(old_dates), len(new_dates)
+    window = min(window, n_old)
+    refit_from = n_old - window
+    anchor_from = max(0, refit_from - window)
+
+    # Only the trailing window and the new months are read
+    csv_meta, _, csv_values = f.read_zillow_csv(
+        house_csv, meta_columns=('RegionID', 'SizeRank', 'RegionName', 'StateName'),
+        date_columns=csv_dates[refit_from:])
+    csv_ids = csv_meta['RegionID'].to_numpy()
+    old_column = {region_id: i for i, region_id in enumerate(old_ids)}
+    # Region metadata from the csv replaces the stored metadata
+    old_meta = pd.DataFrame({
+        'RegionName': meta['metros'][:n_metros],
+        'StateName': (meta.get('states') or [None] * n_metros)[:n_metros],
+        'SizeRank': (meta.get('size_ranks') or [None] * n_metros)[:n_metros],
+    }, index=old_ids)
+    region_meta = pd.concat([old_meta, csv_meta.set_index('RegionID')[old_meta.columns]])
+    region_meta = region_meta[~region_meta.index.duplicated(keep='last')]
+    # Regions missing from the new drop are dropped, as a full transform would
+    in_csv = set(csv_ids.tolist())
+    kept_ids = [region_id for region_id in old_ids if region_id in in_csv]
+    region_ids = kept_ids + [i for i in csv_ids.tolist() if i not in old_column]
+    region_meta = region_meta.loc[region_ids]
+    column = {region_id: i for i, region_id in enumerate(region_ids)}
+
+    dates = pd.to_datetime(csv_dates, format='%Y-%m-%d')
+    values = np.zeros((n_old + n_new, len(region_ids)), dtype='float64')
+    values[:n_old, :len(kept_ids)] = old_values[:, [old_column[region_id] for region_id in kept_ids]]
+
+    # Regions already in the store: refit the trailing window, anchored on
+    # the stored months before it (stored zeros are missing months)
+    known = np.array([region_id in old_column for region_id in csv_ids.tolist()], dtype=bool)
+    if known.any():
+        known_ids = csv_ids[known].tolist()
+        anchors = old_values[anchor_from:refit_from][:, [old_column[i] for i in known_ids]].astype('float64')
+        anchors[anchors == 0] = np.nan
+        stacked = np.vstack([anchors, csv_values[known].T])
+        fitted = f.interpolate_quadratic(stacked, dates[anchor_from:])
+        values[refit_from:, [column[i] for i in known_ids]] = np.nan_to_num(fitted[len(anchors):], nan=0.0)
+
+    # New regions have no stored history, so their full rows are read
+    if not known.all():
+        new_ids = set(csv_ids[~known].tolist())
+        full_meta, _, full_values = f.read_zillow_csv(house_csv, meta_columns=('RegionID',))
+        rows = np.flatnonzero(full_meta['RegionID'].isin(new_ids).to_numpy())
+        columns = [column[region_id] for region_id in full_meta['RegionID'].to_numpy()[rows].tolist()]
+        fitted = f.interpolate_quadratic(full_values[rows].T, dates)
+        values[:, columns] = np.nan_to_num(fitted, nan=0.0)
+
+    order = np.argsort(region_meta['RegionName'].to_numpy(dtype=str), kind='stable')
+    region_meta = region_meta.iloc[order]
+    house = pd.DataFrame(values[:, order], index=dates,
+                         columns=pd.Index(region_meta['RegionName'].tolist(), name='RegionName'))
+    house.attrs['region_ids'] = [int(region_id) for region_id in region_meta.index]
+    house.attrs.update(f.region_metadata(region_meta))
+    return house
+
+def update_entry(house_csv, cache_dir=dc.CACHE_DIR, window=WINDOW):
+    '''Brings the cache entry for a csv up to date with its current contents
+    without publishing it. When the previous entry's months are a prefix of
+    the csv's, only the new months, the trailing window and any new regions
+    are read and interpolated, and regions no longer in the csv are dropped;
+    otherwise the whole csv is transformed. Returns the entry path and the
+    mode, 'unchanged', 'full' or 'incremental'.'''
+    key = dc.source_key(house_csv, f.home_price_inventory_transform, {})
+    path = dc.entry_dir(house_csv, key, cache_dir)
+    if (dc.read_meta(path) or {}).get('cache_version') == dc.CACHE_VERSION:
+        return path, 'unchanged'
+
+    previous = dc.entries(house_csv, cache_dir)
+    meta = dc.read_meta(previous[0]) if previous else None
+    header = f.read_zillow_header(house_csv)
+    csv_dates = [column for column in header if column not in f.META_COLUMNS]
+    if (meta is None or not meta.get('region_ids') or len(meta['dates']) < 2
+            or csv_dates[:len(meta['dates'])] != meta['dates']):
+        return full_ingest(house_csv, cache_dir), 'full'
+
+    old_values = np.load(os.path.join(previous[0], 'values.npy'))
+    house = incremental_values(house_csv, meta, old_values, window)
+    dc.save_frame(add_rollups(house), path, key)
+    dc.prune_stale(house_csv, path, cache_dir)
+    return path, 'incremental'
+
+def record_ingest(house_csv, path, cache_dir, mode, seconds):
+    '''Publishes an updated entry along with how it was ingested and how
+    long it took, which a running server reads into its metrics on reload.'''
+    metrics.INGEST_SECONDS.observe(seconds, mode=mode)
+    dc.publish(house_csv, path, cache_dir, ingest={'mode': mode, 'seconds': seconds})
+
+def ingest(house_csv, cache_dir=dc.CACHE_DIR, window=WINDOW):
+    '''Updates the cache entry for a csv (see update_entry) and publishes
+    it. Returns the published entry path and whether the update was
+    incremental.'''
+    path, mode, seconds = timed_ingest(house_csv, cache_dir, window)
+    record_ingest(house_csv, path, cache_dir, mode, seconds)
+    return path, mode == 'incremental'
+
+def timed_ingest(house_csv, cache_dir, window):
+    '''Updates the cache entry for one csv without publishing it and returns
+    the entry path, the mode and the time taken. Run in a worker process, so
+    only these small values are pickled back.'''
+    start = time.perf_counter()
+    path, mode = update_entry(house_csv, cache_dir, window)
+    return path, mode, time.perf_counter() - start
+
+def ingest_many(paths, cache_dir=dc.CACHE_DIR, window=WINDOW, workers=None):
+    '''Ingests several csv files, each in its own worker process (up to
+    workers, by default one per core). Workers only write their cache
+    entries; the entries are published from this process as each file
+    finishes, so concurrent updates to published.json cannot be lost.
+    Yields (csv, entry path, mode, seconds) in completion order.'''
+    paths = list(dict.fromkeys(paths))
+    workers = min(len(paths), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        finished = ((house_csv, timed_ingest(house_csv, cache_dir, window)) for house_csv in paths)
+        for house_csv, (path, mode, seconds) in finished:
+            record_ingest(house_csv, path, cache_dir, mode, seconds)
+            yield house_csv, path, mode, seconds
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(timed_ingest, house_csv, cache_dir, window): house_csv for house_csv in paths}
+        for future in as_completed(futures):
+            path, mode, seconds = future.result()
+            record_ingest(futures[future], path, cache_dir, mode, seconds)
+            yield futures[future], path, mode, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest new Zillow csv drops into the data cache.')
+    parser.add_argument('csv', nargs='*', help='Zillow csv files to ingest')
+    parser.add_argument('--series', nargs='*', default=[],
+                        help="registered series names to ingest (see dataset_registry), or 'all'")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--window', type=int, default=WINDOW,
+                        help='trailing months to re-interpolate')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    args = parser.parse_args()
+
+    paths = list(args.csv)
+    if args.series:
+        from dataset_registry import DatasetRegistry
+        registry = DatasetRegistry(data_dir=args.data_dir)
+        if args.series == ['all']:
+            # Every base series whose csv is present; derived ones share it
+            names = [name for name, spec in registry.specs.items()
+                     if spec.base is None and os.path.exists(registry.path(name))]
+        else:
+            names = args.series
+        paths += [registry.path(name) for name in names]
+    if not paths:
+        parser.error('nothing to ingest')
+
+    cache_dir = os.path.join(args.data_dir, 'cache')
+    start = time.perf_counter()
+    for house_csv, path, mode, seconds in ingest_many(paths, cache_dir, args.window, args.workers):
+        print(f"{house_csv}: {mode} -> "
+              f"{os.path.basename(path)} in {seconds:.2f}s")
+    print(f'{len(set(paths))} files in {time.perf_counter() - start:.2f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# A file to store the in-process metrics exposed in Prometheus text format
+
+# Imports
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets for durations in seconds and payload sizes in bytes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Functions
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def format_labels(labels):
+    '''Returns {name="value",...} for a dict of label values, or "".'''
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+# Classes
+class Metric:
+    '''A named metric with a fixed set of label names. Values are kept per
+    combination of label values.'''
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self.render_sample(dict(zip(self.labelnames, key)), value))
+        return lines
+
+    def render_sample(self, labels, value):
+        return [f'{self.name}{format_labels(labels)} {format_value(value)}']
+
+class Counter(Metric):
+    '''A value that only goes up, e.g. a number of requests.'''
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    '''A value that is set to the current state, e.g. a cache size.'''
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+class Histogram(Metric):
+    '''Counts observations into cumulative buckets and keeps their sum.'''
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        '''Observes the wall time spent in a with block.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render_sample(self, labels, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{format_labels(dict(labels, le=format_value(bound)))} {cumulative}')
+        lines.append(f'{self.name}_sum{format_labels(labels)} {format_value(total)}')
+        lines.append(f'{self.name}_count{format_labels(labels)} {cumulative}')
+        return lines
+
+class MetricsRegistry:
+    '''Holds the metrics of the process and renders them in the Prometheus
+    text exposition format. Collectors are called before rendering to set
+    gauges from state that is kept elsewhere, like the response cache.'''
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self.add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(name, help_text, labelnames, buckets))
+
+    def collector(self, function):
+        '''Registers a function called before every render.'''
+        self.collectors.append(function)
+        return function
+
+    def render(self):
+        for function in self.collectors:
+            function()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# --- Metrics of the app ---
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'housing_request_seconds', 'Time to handle a request, by route, method and status.',
+    ('route', 'method', 'status'))
+REQUEST_STAGE_SECONDS = REGISTRY.histogram(
+    'housing_request_stage_seconds', 'Time spent in each stage of a request, by route and stage.',
+    ('route', 'stage'))
+RESPONSE_BYTES = REGISTRY.histogram(
+    'housing_response_bytes', 'Size of response bodies, by route and content type.',
+    ('route', 'content_type'), buckets=SIZE_BUCKETS)
+DATASET_LOAD_SECONDS = REGISTRY.histogram(
+    'housing_dataset_load_seconds', 'Time to load a series into a ChartEngine, by series.',
+    ('series',))
+TRANSFORM_SECONDS = REGISTRY.histogram(
+    'housing_transform_seconds', 'Time to read a transformed csv, from the disk cache or by transforming it.',
+    ('source',))
+INGEST_SECONDS = REGISTRY.histogram(
+    'housing_ingest_seconds', 'Time to ingest a csv drop into the disk cache, by mode.', ('mode',))
+SLOW_REQUESTS = REGISTRY.counter(
+    'housing_slow_requests_total', 'Requests slower than the profiling threshold, by route.', ('route',))
@@ -0,0 +1,109 @@
+# A file to store the opt-in profiler that dumps profiles of slow requests
+
+# Imports
+import cProfile
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Classes
+class StackSampler:
+    '''Samples the call stack of one thread at a fixed interval from a
+    daemon thread and counts the stacks in the collapsed "a;b;c count"
+    format that flamegraph.pl and speedscope read.'''
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as stacks_file:
+            for stack, count in self.stacks.most_common():
+                stacks_file.write(f'{stack} {count}\n')
+
+class SlowRequestProfiler:
+    '''Profiles a random sample of requests and keeps the profiles of the
+    ones slower than a threshold. mode='cprofile' writes cProfile .prof
+    files (for pstats, snakeviz or flameprof); mode='stacks' writes sampled
+    collapsed stacks ready for a flame graph. Nothing is profiled unless the
+    profiler is enabled.'''
+
+    def __init__(self, threshold_ms=None, sample_rate=1.0, mode='cprofile', directory='profiles'):
+        if mode not in ('cprofile', 'stacks'):
+            raise ValueError(f"Unknown profile mode '{mode}'")
+        self.threshold = threshold_ms / 1000 if threshold_ms else None
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.directory = directory
+        self.sequence = itertools.count(1)
+
+    @property
+    def enabled(self):
+        return self.threshold is not None
+
+    def start(self):
+        '''Starts profiling the current request if it is sampled. Returns a
+        handle for finish(), or None.'''
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler per process
+                return None
+        else:
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        return profiler, time.perf_counter()
+
+    def finish(self, handle, label):
+        '''Stops profiling and writes the profile if the request took longer
+        than the threshold. Returns the path written, or None.'''
+        if handle is None:
+            return None
+        profiler, start = handle
+        if self.mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+        elapsed = time.perf_counter() - start
+        if elapsed < self.threshold:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_') or 'root'
+        extension = 'prof' if self.mode == 'cprofile' else 'folded'
+        stamp = f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-{next(self.sequence)}'
+        path = os.path.join(self.directory, f'{name}-{stamp}-{int(elapsed * 1000)}ms.{extension}')
+        if self.mode == 'cprofile':
+            profiler.dump_stats(path)
+        else:
+            profiler.dump(path)
+        return path
@@ -0,0 +1,117 @@
+# A file to store the in-process cache of serialized api responses
+
+# Imports
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Functions
+def make_etag(*parts):
+    '''Returns a strong ETag for a response built from the given parts. The
+    parts must include the dataset version so new data changes the tag.'''
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+# Classes
+class ResponseCache:
+    '''A thread-safe LRU of serialized response bodies, bounded both by the
+    number of entries and by the total size of the bodies in bytes.'''
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        '''Returns the cached body for key, or None on a miss.'''
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        '''Stores a body, evicting the least recently used entries until the
+        cache is back within its limits. Bodies larger than the whole byte
+        budget are not stored.'''
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = body
+            self.size += len(body)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        '''Drops every entry. The hit and miss counters are kept.'''
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        '''Returns the entry count, size and hit/miss counters.'''
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+class PinnedResponses:
+    '''Response bodies kept outside the LRU, for the few responses nearly
+    every visitor asks for, so a burst of other requests never evicts them
+    and they are compressed once per dataset generation. Holds up to
+    max_entries bodies of the current generation; the first body stored
+    for a new generation drops the old ones.'''
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.generation = None
+        self.entries = {}
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        '''Returns the pinned body for key, or None if it is not pinned.'''
+        with self.lock:
+            body = self.entries.get(key) if generation == self.generation else None
+            if body is not None:
+                self.hits += 1
+            return body
+
+    def put(self, key, body, generation):
+        '''Pins a body. Returns False, leaving it to the LRU, when the body
+        is for an older generation or max_entries are already pinned.'''
+        with self.lock:
+            if self.generation is None or generation > self.generation:
+                self.entries = {}
+                self.generation = generation
+            if generation != self.generation or (key not in self.entries
+                                                 and len(self.entries) >= self.max_entries):
+                return False
+            self.entries[key] = body
+            return True
+
+    def stats(self):
+        '''Returns the pinned entry count, size and hit counter.'''
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': sum(len(body) for body in self.entries.values()),
+                'hits': self.hits,
+            }
@@ -0,0 +1,75 @@
+# A file to store the state, size tier and national rollups of a series
+
+# Imports
+import numpy as np
+import pandas as pd
+
+# SizeRank tiers: (name, first rank, last rank), SizeRank 1 being the largest metro
+SIZE_TIERS = [
+    ('Top 10 Metros, US', 1, 10),
+    ('Metros 11-50, US', 11, 50),
+    ('Metros 51-100, US', 51, 100),
+    ('Metros 101-250, US', 101, 250),
+    ('Metros 251+, US', 251, None),
+]
+
+# Pseudo-regions get negative RegionIDs that stay the same across data
+# versions: -1 for the nation, -2, -3, ... for the size tiers and
+# -1000 - (a two letter state code read as a base 26 number) for states
+NATIONAL_ID = -1
+
+# Functions
+def state_region_id(state):
+    '''Returns the pseudo RegionID of a state's rollup.'''
+    first, second = (ord(letter) - ord('A') for letter in state.upper()[:2])
+    return -1000 - (first * 26 + second)
+
+def rollup_groups(states, size_ranks):
+    '''Returns the (name, pseudo RegionID, member mask) of every rollup for
+    metros with the given StateName and SizeRank values. Rows without a
+    state (the "United States" row of the Zillow files) are in no group.'''
+    states = pd.Series(states, dtype='object')
+    ranks = pd.to_numeric(pd.Series(size_ranks), errors='coerce').to_numpy()
+    metro = (states.notna() & (states.astype(str).str.len() == 2)).to_numpy()
+    groups = [('All Metros, US', NATIONAL_ID, metro)]
+    for i, (name, first, last) in enumerate(SIZE_TIERS):
+        in_tier = metro & (ranks >= first) & (ranks <= (last if last is not None else np.inf))
+        groups.append((name, NATIONAL_ID - 1 - i, in_tier))
+    for state in sorted(set(states[metro])):
+        groups.append((f'All Metros, {state}', state_region_id(state), metro & (states == state).to_numpy()))
+    return [group for group in groups if group[2].any()]
+
+def add_rollups(house):
+    '''Returns the transformed frame with one extra column per state, per
+    SizeRank tier and for the nation, each the SizeRank-weighted mean of
+    the metros in it that have data that month. Weights are 1 / SizeRank,
+    which by Zipf's law for city sizes tracks metro population. All the
+    rollups are computed with one matrix product. Frames without StateName
+    and SizeRank metadata are returned unchanged.'''
+    states, size_ranks = house.attrs.get('states'), house.attrs.get('size_ranks')
+    if not states or not size_ranks or house.attrs.get('rollups'):
+        return house
+    groups = rollup_groups(states, size_ranks)
+    if not groups:
+        return house
+
+    values = house.to_numpy(dtype='float64')
+    # The transforms fill missing months with 0
+    valid = values != 0
+    ranks = pd.to_numeric(pd.Series(size_ranks), errors='coerce').to_numpy(dtype='float64')
+    weights = 1 / np.maximum(ranks, 1)
+    membership = np.column_stack([mask * weights for _, _, mask in groups])
+    membership = np.nan_to_num(membership)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (values @ membership) / (valid @ membership)
+    means = np.nan_to_num(means, nan=0.0)
+
+    names = [name for name, _, _ in groups]
+    rollup = pd.DataFrame(means, index=house.index, columns=pd.Index(names, name='RegionName'))
+    combined = pd.concat([house, rollup], axis=1)
+    combined.attrs = dict(house.attrs)
+    combined.attrs['region_ids'] = list(house.attrs.get('region_ids') or []) + [region_id for _, region_id, _ in groups]
+    combined.attrs['states'] = list(states) + [name.split(', ')[1] for name in names]
+    combined.attrs['size_ranks'] = list(size_ranks) + [None] * len(groups)
+    combined.attrs['rollups'] = len(groups)
+    return combined
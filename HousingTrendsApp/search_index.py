@@ -0,0 +1,90 @@
+# A file to store the prebuilt index used to search region names
+
+# Imports
+import heapq
+import math
+import re
+from bisect import bisect_left
+
+# Start of every word in a region name, e.g. "Los Angeles, CA" is also
+# searchable as "angeles, ca" and "ca"
+WORD_START = re.compile(r'(?<![a-z0-9])[a-z0-9]')
+
+# Classes
+class CitySearchIndex:
+    '''Ranked prefix and substring search over region names and states.
+
+    Two sorted arrays, one of whole names and one of the other word-start
+    suffixes of each name, answer prefix queries with binary searches and
+    stop as soon as enough matches are found. Queries that are not a word
+    prefix fall back to a trigram index, which narrows the candidates to
+    names containing every trigram of the query before checking the
+    substring. Matches are ranked: names starting with the query first,
+    then names with a word (city or state) starting with it, then other
+    substrings. Within each of those, larger regions (lower Zillow SizeRank)
+    come first, then names without a rank, alphabetically.'''
+
+    def __init__(self, names, size_ranks=None):
+        self.names = list(names)
+        self.lowered = [name.lower() for name in self.names]
+        if size_ranks is None or len(size_ranks) != len(self.names):
+            size_ranks = [None] * len(self.names)
+        self.rank_keys = [(math.inf if rank is None else rank, lowered)
+                          for rank, lowered in zip(size_ranks, self.lowered)]
+        words = []
+        self.trigrams = {}
+        for i, lowered in enumerate(self.lowered):
+            for match in WORD_START.finditer(lowered):
+                if match.start() > 0:
+                    words.append((lowered[match.start():], i))
+            for j in range(len(lowered) - 2):
+                self.trigrams.setdefault(lowered[j:j + 3], set()).add(i)
+        whole = sorted((lowered, i) for i, lowered in enumerate(self.lowered))
+        words.sort()
+        self.tiers = [
+            ([key for key, _ in whole], [i for _, i in whole]),
+            ([key for key, _ in words], [i for _, i in words]),
+        ]
+
+    def best(self, positions, n):
+        '''Returns the n highest ranked of the given name positions.'''
+        return heapq.nsmallest(n, positions, key=self.rank_keys.__getitem__)
+
+    def prefix_matches(self, query, limit, found):
+        '''Adds up to limit names with a word starting with the (lowercase)
+        query to the ordered dict-like found, whole-name matches first.'''
+        for keys, positions in self.tiers:
+            if len(found) >= limit:
+                return
+            lo = bisect_left(keys, query)
+            hi = bisect_left(keys, query + '\uffff', lo)
+            # A name can have several words starting with the query
+            candidates = set(positions[lo:hi]).difference(found)
+            for i in self.best(candidates, limit - len(found)):
+                found[i] = None
+
+    def substring_matches(self, query):
+        '''Returns the positions of names containing the (lowercase) query,
+        which must be at least three characters long.'''
+        sets = [self.trigrams.get(query[j:j + 3], ()) for j in range(len(query) - 2)]
+        # Intersect starting from the rarest trigram to keep the sets small
+        sets.sort(key=len)
+        candidates = set(sets[0])
+        for ids in sets[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(ids)
+        return [i for i in candidates if query in self.lowered[i]]
+
+    def search(self, query, limit=20):
+        '''Returns up to limit names matching query, best matches first.'''
+        query = query.strip().lower()
+        if not query:
+            return []
+        found = {}
+        self.prefix_matches(query, limit, found)
+        if len(found) < limit and len(query) >= 3:
+            candidates = set(self.substring_matches(query)).difference(found)
+            for i in self.best(candidates, limit - len(found)):
+                found[i] = None
+        return [self.names[i] for i in found]
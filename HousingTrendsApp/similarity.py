@@ -0,0 +1,76 @@
+# A file to store the index used to find metros with similar trajectories
+
+# Imports
+import numpy as np
+
+# Fewest months two metros must both have data for to be compared
+MIN_OVERLAP = 12
+
+# Classes
+class TrajectoryIndex:
+    '''Finds the metros whose series move most like a given metro's.
+
+    Similarity is the Pearson correlation of the two series over the months
+    both have data for (within an optional window), which ranks metros the
+    same way as the Euclidean distance between z-normalized series. Each
+    metro is z-normalized once up front and stored with missing months as 0
+    next to its square and its has-data mask, so every correlation term for
+    every metro comes out of one matrix product with three vectors built
+    from the query metro.'''
+
+    def __init__(self, values, zero_is_missing=True):
+        values = np.array(values, dtype='float64')
+        if zero_is_missing:
+            values[values == 0] = np.nan
+        valid = ~np.isnan(values)
+        counts = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.nansum(values, axis=0) / counts
+            stds = np.sqrt(np.nansum((values - means) ** 2, axis=0) / counts)
+        # Constant or empty series cannot be correlated with anything
+        stds[~(stds > 0)] = np.nan
+        z = np.where(valid, (values - means) / stds, 0.0)
+        z[:, np.isnan(stds)] = 0.0
+        valid[:, np.isnan(stds)] = False
+        self.valid = valid
+        # months x (3 * metros): z, z ** 2 and the mask side by side
+        self.stacked = np.hstack([z, z ** 2, valid.astype('float64')])
+        self.n = values.shape[1]
+
+    def correlations(self, position, lo=0, hi=None):
+        '''Returns the correlation of every metro with the metro at position
+        over rows lo:hi, and the number of months each pair was compared
+        on. Metros with fewer than MIN_OVERLAP shared months (or fewer than
+        the query has, if that is less) are NaN.'''
+        hi = len(self.stacked) if hi is None else hi
+        n = self.n
+        block = self.stacked[lo:hi]
+        mask = block[:, 2 * n + position]
+        y = block[:, position]
+        weights = np.column_stack([mask, y, y ** 2])
+        # products[field, metro, weight] for field in (z, z ** 2, mask)
+        products = (block.T @ weights).reshape(3, n, 3)
+        count = products[2, :, 0]
+        sx, sxx, sxy = products[0, :, 0], products[1, :, 0], products[0, :, 1]
+        sy, syy = products[2, :, 1], products[2, :, 2]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = sxy - sx * sy / count
+            var_x = sxx - sx ** 2 / count
+            var_y = syy - sy ** 2 / count
+            r = cov / np.sqrt(var_x * var_y)
+        min_overlap = max(3, min(MIN_OVERLAP, int(mask.sum())))
+        r[(count < min_overlap) | ~(var_x > 1e-12) | ~(var_y > 1e-12)] = np.nan
+        return np.clip(r, -1, 1), count.astype('int64')
+
+    def similar(self, position, k=10, lo=0, hi=None, limit=None):
+        '''Returns up to k (position, correlation, months) tuples for the
+        metros most similar to the metro at position, best first, not
+        including the metro itself. Only the first limit columns (all by
+        default) are candidates.'''
+        r, count = self.correlations(position, lo, hi)
+        r[position] = np.nan
+        candidates = np.flatnonzero(~np.isnan(r[:limit]))
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-r[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-r[candidates], kind='stable')]
+        return [(int(i), float(r[i]), int(count[i])) for i in candidates]
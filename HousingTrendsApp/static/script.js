@@ -3,15 +3,27 @@
 // --- Global Variables ---
 let priceChart = null;
 let inventoryChart = null;
-let allCities = [];
-let selectedCities = [];
+let searchRequestId = 0;
+const SEARCH_LIMIT = 20;
+const DEFAULT_CITIES = ['Los Angeles, CA', 'New York, NY'];
+let selectedCities = []; // { id: RegionID, name } objects
+let dropdownCities = [];
 const MAX_CITIES = 8;
 let highlightedIndex = -1;
 let chartUpdateTimeout;
-
-// Data stores
-let fullPriceData = null;
-let fullInventoryData = null;
+const PIXELS_PER_POINT = 4;
+const MIN_POINTS = 24;
+const BINARY_MIMETYPE = 'application/vnd.housing-trends.f32';
+
+// Line colours, given to the cities in the order they were picked
+const COLOR_PALETTE = [
+    '#FF6385', '#36A2EB', '#FFCE56', '#4BC0C0',
+    '#9966FF', '#FF9F40', '#C9CBCF', '#7CFFB2'
+];
+const COLOR_PALETTE2 = [
+    "#FF638576", "#36A3EB7A", "#FFCF567D", "#4BC0C07F",
+    "#9966FF7E", "#FFA04078", "#C9CBCF7D", "#7CFFB379"
+];
 
 // State for time ranges
 let activePriceTimeRange = 'max';
@@ -30,38 +42,131 @@ const inventoryTimeRangeContainer = document.getElementById('inventory-time-rang
 // --- Charting Functions ---
 
 /**
- * Applies a time filter to a given dataset.
- * @param {object} fullData - The complete, unfiltered dataset.
+ * Fetches chart data for the selected cities, limited to a time range.
+ * The server slices the range and downsamples to about one point per few
+ * pixels of canvas width, so only what is drawn is transferred.
+ * @param {string} endpoint - The API endpoint (e.g., '/api/pricedata').
+ * @param {string} canvasId - The ID of the canvas the data is drawn on.
  * @param {string} timeRange - The active time range ('max', '5y', '2y', '1y').
- * @returns {object} The filtered data object.
+ * @returns {Promise<object>} The chart data object.
  */
-function applyTimeFilter(fullData, timeRange) {
-    if (!fullData) return null;
-
-    const filteredData = JSON.parse(JSON.stringify(fullData)); // Deep copy
-    const { labels } = filteredData;
-    
-    let startIndex = 0;
-    if (timeRange !== 'max') {
-        const startDate = new Date();
-        let yearsToSubtract = 0;
-        switch(timeRange) {
-            case '5y': yearsToSubtract = 5; break;
-            case '2y': yearsToSubtract = 2; break;
-            case '1y': yearsToSubtract = 1; break;
-        }
-        startDate.setFullYear(startDate.getFullYear() - yearsToSubtract);
-        
-        startIndex = labels.findIndex(label => new Date(label) >= startDate);
-        if(startIndex === -1) startIndex = 0;
-    }
+async function fetchChartData(endpoint, canvasId, timeRange) {
+    const params = new URLSearchParams({
+        ids: selectedCities.map(city => city.id).join(','),
+        range: timeRange,
+        max_points: maxPointsFor(canvasId)
+    });
+    const response = await fetch(`${endpoint}?${params}`, { headers: { Accept: BINARY_MIMETYPE } });
+    if (!response.ok) throw new Error(`${endpoint} fetch failed`);
+    const { header, buffer, offset } = parseBinaryFrame(await response.arrayBuffer());
+    return orderBySelection(readFrameChart(header, buffer, offset).chartData);
+}
+
+/**
+ * Puts a chart's datasets in the order the cities were picked and colours
+ * them by that order, so adding a city never recolours or moves the ones
+ * already drawn. The server sends the datasets in column order so that any
+ * order of the same cities shares one cached response.
+ * @param {object} chartData - A chart data object.
+ * @returns {object} The same chart data object.
+ */
+function orderBySelection(chartData) {
+    const rank = new Map(selectedCities.map((city, i) => [city.id, i]));
+    chartData.datasets.sort((a, b) => rank.get(a.regionId) - rank.get(b.regionId));
+    chartData.datasets.forEach((dataset, i) => {
+        dataset.borderColor = COLOR_PALETTE[i % COLOR_PALETTE.length];
+        dataset.backgroundColor = COLOR_PALETTE2[i % COLOR_PALETTE2.length];
+    });
+    return chartData;
+}
+
+/**
+ * Splits a binary chart frame into its json header and the byte offset of
+ * its float32 values. The frame is the magic "HTF1", the header length as a
+ * little-endian uint32, the header and then the values of every dataset.
+ * @param {ArrayBuffer} buffer - The response body.
+ * @returns {object} { header, buffer, offset }.
+ */
+function parseBinaryFrame(buffer) {
+    const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+    if (magic !== 'HTF1') throw new Error('Not a chart data frame');
+    const headerLength = new DataView(buffer).getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    return { header, buffer, offset: 8 + headerLength };
+}
 
-    filteredData.labels = labels.slice(startIndex);
-    filteredData.datasets.forEach(dataset => {
-        dataset.data = dataset.data.slice(startIndex);
+/**
+ * Rebuilds the ISO date labels of a chart from its first date and cadence,
+ * and the point offsets when the server downsampled it.
+ * @param {object} header - A chart header from a binary frame.
+ * @returns {string[]} The date labels.
+ */
+function frameLabels(header) {
+    const [year, month, day] = header.start ? header.start.split('-').map(Number) : [0, 0, 0];
+    const offsets = header.offsets || Array.from({ length: header.points }, (_, i) => i);
+    return offsets.map(step => {
+        // Zillow monthly dates are month ends: day 0 of the next month
+        const date = header.cadence === 'weekly'
+            ? new Date(Date.UTC(year, month - 1, day + 7 * step))
+            : new Date(Date.UTC(year, month + step, 0));
+        return date.toISOString().slice(0, 10);
     });
-    
-    return filteredData;
+}
+
+/**
+ * Reads one chart out of a binary frame. Each dataset's data is a
+ * Float32Array view straight onto the response body, with no parsing.
+ * @param {object} header - The chart's header.
+ * @param {ArrayBuffer} buffer - The response body.
+ * @param {number} offset - Byte offset of the chart's first value.
+ * @returns {object} { chartData, offset } with the offset just past the chart.
+ */
+function readFrameChart(header, buffer, offset) {
+    const datasets = header.datasets.map(dataset => {
+        dataset.data = new Float32Array(buffer, offset, header.points);
+        offset += header.points * Float32Array.BYTES_PER_ELEMENT;
+        return dataset;
+    });
+    return { chartData: { labels: frameLabels(header), datasets }, offset };
+}
+
+/**
+ * Returns the max_points to request for a canvas: about one point per few
+ * pixels of its width.
+ * @param {string} canvasId - The ID of the canvas the data is drawn on.
+ * @returns {number} The maximum number of points to draw.
+ */
+function maxPointsFor(canvasId) {
+    const canvas = document.getElementById(canvasId);
+    return Math.max(MIN_POINTS, Math.floor(canvas.clientWidth / PIXELS_PER_POINT));
+}
+
+/**
+ * Fetches several metrics for the selected cities in one request, each
+ * limited to its own time range.
+ * @param {object} charts - Maps metric name to { canvasId, timeRange }.
+ * @returns {Promise<object>} Maps metric name to its chart data object.
+ */
+async function fetchSeriesData(charts) {
+    const params = new URLSearchParams({
+        metrics: Object.keys(charts).join(','),
+        ids: selectedCities.map(city => city.id).join(',')
+    });
+    for (const [metric, { canvasId, timeRange }] of Object.entries(charts)) {
+        params.set(`range.${metric}`, timeRange);
+        params.set(`max_points.${metric}`, maxPointsFor(canvasId));
+    }
+    const response = await fetch(`/api/series?${params}`, { headers: { Accept: BINARY_MIMETYPE } });
+    if (!response.ok) throw new Error('Series data fetch failed');
+    let { header, buffer, offset } = parseBinaryFrame(await response.arrayBuffer());
+
+    // The metrics' values follow the header in the same order
+    const chartData = {};
+    for (const [metric, metricHeader] of Object.entries(header.series)) {
+        ({ chartData: chartData[metric], offset } = readFrameChart(metricHeader, buffer, offset));
+        orderBySelection(chartData[metric]);
+    }
+    return chartData;
 }
 
 /**
@@ -149,30 +254,18 @@ function updateAllCharts() {
         if (selectedCities.length === 0) {
             if (priceChart) { priceChart.destroy(); priceChart = null; }
             if (inventoryChart) { inventoryChart.destroy(); inventoryChart = null; }
-            fullPriceData = null;
-            fullInventoryData = null;
             return;
         }
         
         try {
-            // Fetch both datasets in parallel
-            const [priceResponse, inventoryResponse] = await Promise.all([
-                fetch(`/api/pricedata?cities=${selectedCities.join(',')}`),
-                fetch(`/api/inventorydata?cities=${selectedCities.join(',')}`)
-            ]);
+            // Fetch both metrics in one request, each for its own time range
+            const { price, inventory } = await fetchSeriesData({
+                price: { canvasId: 'priceChart', timeRange: activePriceTimeRange },
+                inventory: { canvasId: 'inventoryChart', timeRange: activeInventoryTimeRange }
+            });
 
-            if (!priceResponse.ok) throw new Error('Price data fetch failed');
-            if (!inventoryResponse.ok) throw new Error('Inventory data fetch failed');
-
-            fullPriceData = await priceResponse.json();
-            fullInventoryData = await inventoryResponse.json();
-
-            // Filter and render both charts
-            const filteredPriceData = applyTimeFilter(fullPriceData, activePriceTimeRange);
-            priceChart = renderChart(priceChart, 'priceChart', filteredPriceData, createChartOptions(true));
-
-            const filteredInventoryData = applyTimeFilter(fullInventoryData, activeInventoryTimeRange);
-            inventoryChart = renderChart(inventoryChart, 'inventoryChart', filteredInventoryData, createChartOptions(false));
+            priceChart = renderChart(priceChart, 'priceChart', price, createChartOptions(true));
+            inventoryChart = renderChart(inventoryChart, 'inventoryChart', inventory, createChartOptions(false));
 
         } catch (error) {
             console.error("Could not fetch chart data:", error);
@@ -186,21 +279,51 @@ function updateAllCharts() {
 
 // --- City Selection UI Functions ---
 
-function renderDropdown() {
+/**
+ * Asks the server for the best matching cities for a search term.
+ * @param {string} searchTerm - The text typed into the search box.
+ * @param {number} limit - The maximum number of matches to return.
+ * @returns {Promise<object[]>} The matching { id, name } cities, best first.
+ */
+async function searchCities(searchTerm, limit) {
+    const params = new URLSearchParams({ q: searchTerm, limit });
+    const response = await fetch(`/api/cities?${params}`);
+    if (!response.ok) throw new Error('City search failed');
+    return response.json();
+}
+
+async function renderDropdown() {
+    const searchTerm = searchInput.value.trim();
+    const requestId = ++searchRequestId;
+    if (searchTerm.length === 0) {
+        cityDropdown.innerHTML = '';
+        dropdownCities = [];
+        cityDropdown.classList.add('hidden');
+        return;
+    }
+
+    let matches;
+    try {
+        matches = await searchCities(searchTerm, SEARCH_LIMIT + selectedCities.length);
+    } catch (error) {
+        console.error("City search failed:", error);
+        return;
+    }
+    // Ignore responses for searches the user has already typed past
+    if (requestId !== searchRequestId) return;
+
     cityDropdown.innerHTML = '';
     highlightedIndex = -1;
-    const searchTerm = searchInput.value.toLowerCase();
-    
-    const availableCities = allCities
-        .filter(city => !selectedCities.includes(city))
-        .filter(city => city.toLowerCase().includes(searchTerm));
+    dropdownCities = matches
+        .filter(city => !selectedCities.some(selected => selected.id === city.id))
+        .slice(0, SEARCH_LIMIT);
 
-    if (availableCities.length > 0 && searchTerm.length > 0) {
+    if (dropdownCities.length > 0) {
         cityDropdown.classList.remove('hidden');
-        availableCities.forEach(city => {
+        dropdownCities.forEach(city => {
             const item = document.createElement('div');
             item.className = 'px-4 py-2 cursor-pointer hover:bg-gray-100';
-            item.textContent = city;
+            item.textContent = city.name;
             item.addEventListener('click', () => selectCity(city));
             cityDropdown.appendChild(item);
         });
@@ -214,6 +337,7 @@ function selectCity(city) {
         selectedCities.push(city);
         addCityTag(city);
         searchInput.value = '';
+        searchRequestId++;
         cityDropdown.classList.add('hidden');
         searchInput.focus();
         updateAllCharts();
@@ -225,15 +349,15 @@ function addCityTag(city) {
     const tag = document.createElement('div');
     tag.className = 'bg-blue-100 text-[#246D9E] text-sm font-medium px-2 py-1 rounded-full flex items-center gap-2';
     tag.innerHTML = `
-        <span>${city}</span>
-        <button class="text-[#1D567C] hover:text-blue-700 focus:outline-none" aria-label="Remove ${city}">&times;</button>
+        <span>${city.name}</span>
+        <button class="text-[#1D567C] hover:text-blue-700 focus:outline-none" aria-label="Remove ${city.name}">&times;</button>
     `;
     tag.querySelector('button').addEventListener('click', () => removeCity(city, tag));
     tagsContainer.appendChild(tag);
 }
 
 function removeCity(city, tagElement) {
-    selectedCities = selectedCities.filter(c => c !== city);
+    selectedCities = selectedCities.filter(c => c.id !== city.id);
     tagsContainer.removeChild(tagElement);
     updateAllCharts();
     validateSelection();
@@ -260,7 +384,7 @@ function handleKeyboardNavigation(e) {
             break;
         case 'Enter':
             e.preventDefault();
-            if (highlightedIndex > -1) selectCity(items[highlightedIndex].textContent);
+            if (highlightedIndex > -1) selectCity(dropdownCities[highlightedIndex]);
             return; 
         case 'Escape':
             cityDropdown.classList.add('hidden');
@@ -317,12 +441,12 @@ function setupSidebarNavigation() {
 
 async function initialize() {
     try {
-        const response = await fetch('/api/cities');
-        if (!response.ok) throw new Error('Failed to fetch city list.');
-        allCities = await response.json();
-        
-        if (allCities.includes('Los Angeles, CA')) selectCity('Los Angeles, CA'); 
-        if (allCities.includes('New York, NY')) selectCity('New York, NY');
+        // Only the default cities are looked up; the full list is never sent
+        const matches = await Promise.all(DEFAULT_CITIES.map(city => searchCities(city, 1)));
+        DEFAULT_CITIES.forEach((city, i) => {
+            const [best] = matches[i];
+            if (best && best.name === city) selectCity(best);
+        });
 
         if (selectedCities.length === 0) updateAllCharts();
 
@@ -349,28 +473,40 @@ document.addEventListener('click', (e) => {
     }
 });
 
-priceTimeRangeContainer.addEventListener('click', (e) => {
+priceTimeRangeContainer.addEventListener('click', async (e) => {
     if (e.target.tagName === 'BUTTON') {
         const newRange = e.target.dataset.range;
         if (newRange !== activePriceTimeRange) {
             activePriceTimeRange = newRange;
             priceTimeRangeContainer.querySelector('.active').classList.remove('active');
             e.target.classList.add('active');
-            const filteredData = applyTimeFilter(fullPriceData, activePriceTimeRange);
-            priceChart = renderChart(priceChart, 'priceChart', filteredData, createChartOptions(true));
+            if (selectedCities.length === 0) return;
+            try {
+                const data = await fetchChartData('/api/pricedata', 'priceChart', activePriceTimeRange);
+                priceChart = renderChart(priceChart, 'priceChart', data, createChartOptions(true));
+            } catch (error) {
+                console.error("Could not fetch chart data:", error);
+                selectionError.textContent = "Failed to load chart data.";
+            }
         }
     }
 });
 
-inventoryTimeRangeContainer.addEventListener('click', (e) => {
+inventoryTimeRangeContainer.addEventListener('click', async (e) => {
     if (e.target.tagName === 'BUTTON') {
         const newRange = e.target.dataset.range;
         if (newRange !== activeInventoryTimeRange) {
             activeInventoryTimeRange = newRange;
             inventoryTimeRangeContainer.querySelector('.active').classList.remove('active');
             e.target.classList.add('active');
-            const filteredData = applyTimeFilter(fullInventoryData, activeInventoryTimeRange);
-            inventoryChart = renderChart(inventoryChart, 'inventoryChart', filteredData, createChartOptions(false));
+            if (selectedCities.length === 0) return;
+            try {
+                const data = await fetchChartData('/api/inventorydata', 'inventoryChart', activeInventoryTimeRange);
+                inventoryChart = renderChart(inventoryChart, 'inventoryChart', data, createChartOptions(false));
+            } catch (error) {
+                console.error("Could not fetch chart data:", error);
+                selectionError.textContent = "Failed to load chart data.";
+            }
         }
     }
 });
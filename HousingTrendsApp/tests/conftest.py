@@ -0,0 +1,33 @@
+# A file to store the pytest setup shared by the tests
+
+# Imports
+import importlib
+import os
+import sys
+
+import pytest
+
+# The app modules are flat files in HousingTrendsApp, imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import write_zillow_csv
+
+# Fixtures
+@pytest.fixture(scope='module')
+def flask_app(tmp_path_factory):
+    '''The Flask app serving synthetic price and inventory data.'''
+    data_dir = tmp_path_factory.mktemp('data')
+    write_zillow_csv(data_dir / 'Metro_mlp_uc_sfr_sm_month.csv', n_regions=20, n_months=36)
+    write_zillow_csv(data_dir / 'Metro_invt_fs_uc_sfr_sm_month.csv', n_regions=20, n_months=36, seed=1)
+    patch = pytest.MonkeyPatch()
+    patch.setenv('HOUSING_DATA_DIR', str(data_dir))
+    patch.setenv('HOUSING_PRELOAD', '')
+    patch.setenv('HOUSING_WATCH_INTERVAL', '0')
+    sys.modules.pop('app', None)
+    yield importlib.import_module('app').app
+    patch.undo()
+
+@pytest.fixture(scope='module')
+def client(flask_app):
+    '''A test client for the app serving synthetic price and inventory data.'''
+    return flask_app.test_client()
@@ -0,0 +1,63 @@
+# Tests for the request validation of the api endpoints
+
+# Imports
+import os
+import sys
+
+import pytest
+
+import data_cache as dc
+import ingest
+from response_cache import PinnedResponses, ResponseCache
+
+# Tests
+@pytest.mark.parametrize('ids', ['100001,100002', '100002,100001,100002'])
+def test_chart_data_by_ids(client, ids):
+    response = client.get(f'/api/pricedata?ids={ids}')
+    assert response.status_code == 200
+    assert [dataset['regionId'] for dataset in response.get_json()['datasets']] == [100001, 100002]
+
+@pytest.mark.parametrize('ids', ['99999999999999999999', '100001,-99999999999999999999', '123'])
+def test_chart_data_rejects_unknown_ids(client, ids):
+    response = client.get(f'/api/pricedata?ids={ids}')
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Unknown region id')
+
+def test_similar_by_id(client):
+    response = client.get('/api/similar?id=100001&k=3')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['id'] == 100001
+    assert len(body['similar']) == 3
+    assert 100001 not in [match['id'] for match in body['similar']]
+
+@pytest.mark.parametrize('region_id', ['99999999999999999999', '-99999999999999999999', '123'])
+def test_similar_rejects_unknown_ids(client, region_id):
+    response = client.get(f'/api/similar?id={region_id}')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == f'Unknown region id: {region_id}'
+
+def test_metrics_show_published_ingests(flask_app, client):
+    app_module = sys.modules[flask_app.import_name]
+    cache_dir = os.path.join(app_module.DATA_DIR, 'cache')
+    ingest.ingest(os.path.join(app_module.DATA_DIR, 'Metro_mlp_uc_sfr_sm_month.csv'), cache_dir)
+    seconds = dc.read_published(cache_dir)['Metro_mlp_uc_sfr_sm_month']['ingest']['seconds']
+    app_module.datasets.reload()
+    text = client.get('/metrics').get_data(as_text=True)
+    assert f'housing_ingest_last_seconds{{csv="Metro_mlp_uc_sfr_sm_month"}} {seconds!r}' in text
+
+def test_default_responses_survive_eviction(flask_app, client, monkeypatch):
+    app_module = sys.modules[flask_app.import_name]
+    monkeypatch.setattr(app_module, 'DEFAULT_CITIES', ('Metro 1, TX', 'Metro 2, FL'))
+    monkeypatch.setattr(app_module, 'response_cache', ResponseCache(max_entries=2))
+    monkeypatch.setattr(app_module, 'pinned_responses', PinnedResponses())
+    default = '/api/series?metrics=price,inventory&ids=100002,100001&max_points=10'
+    for path in ('/api/cities', default):
+        client.get(path).get_data()
+
+    # Other selections fill the LRU many times over
+    for region_id in range(100003, 100013):
+        client.get(f'/api/pricedata?ids={region_id}').get_data()
+    for path in ('/api/cities', default):
+        assert client.get(path).headers['X-Cache'] == 'HIT'
+    assert client.get('/api/pricedata?ids=100003').headers['X-Cache'] == 'MISS'
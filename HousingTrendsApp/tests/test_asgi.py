@@ -0,0 +1,100 @@
+# Tests for the ASGI entry point, called the way an ASGI server calls it
+
+# Imports
+import asyncio
+import gzip
+import importlib
+import json
+
+import pytest
+
+# Functions
+@pytest.fixture(scope='module')
+def asgi(flask_app):
+    '''The asgi module, imported once the app fixture has set up the data.'''
+    module = importlib.import_module('asgi')
+    assert module.application.wsgi_app is flask_app
+    yield module
+    if module.application.executor is not None:
+        module.application.executor.shutdown()
+
+def http_scope(path, query='', headers=()):
+    return {
+        'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(name.encode(), value.encode()) for name, value in headers],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+    }
+
+async def empty_body():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+async def call(application, scope, receive=empty_body):
+    '''Calls an ASGI application and returns the messages it sent.'''
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages
+
+def read_response(messages):
+    '''Returns the status, headers and body chunks of the sent messages.'''
+    start, *bodies = messages
+    assert start['type'] == 'http.response.start'
+    assert all(message['type'] == 'http.response.body' for message in bodies)
+    assert not bodies[-1].get('more_body', False)
+    headers = {name.decode(): value.decode() for name, value in start['headers']}
+    return start['status'], headers, [message['body'] for message in bodies if message['body']]
+
+# Tests
+def test_streamed_miss_then_hit(asgi, client):
+    query = 'ids=100001,100002,100003&range=max'
+    # The test client asks without gzip, so it does not fill the same cache entry
+    expected = client.get(f'/api/pricedata?{query}').get_json()
+    scope = http_scope('/api/pricedata', query, [('accept-encoding', 'gzip')])
+
+    status, headers, chunks = read_response(asyncio.run(call(asgi.application, scope)))
+    assert status == 200
+    assert headers['x-cache'] == 'MISS'
+    assert headers['content-encoding'] == 'gzip'
+    # Streamed dataset by dataset, so without a Content-Length
+    assert 'content-length' not in headers
+    assert len(chunks) > 1
+    assert json.loads(gzip.decompress(b''.join(chunks))) == expected
+
+    status, headers, chunks = read_response(asyncio.run(call(asgi.application, scope)))
+    assert status == 200
+    assert headers['x-cache'] == 'HIT'
+    assert int(headers['content-length']) == len(b''.join(chunks))
+    assert json.loads(gzip.decompress(b''.join(chunks))) == expected
+
+def test_not_found(asgi):
+    status, _, _ = read_response(asyncio.run(call(asgi.application, http_scope('/api/nothing'))))
+    assert status == 404
+
+def test_rejects_requests_over_max_pending(asgi, flask_app):
+    application = asgi.AsgiApp(flask_app, threads=1, max_pending=0)
+
+    async def run():
+        # The first request holds the only slot until its body arrives
+        body_sent = asyncio.Event()
+
+        async def slow_body():
+            await body_sent.wait()
+            return await empty_body()
+
+        first = asyncio.create_task(call(application, http_scope('/api/cities'), slow_body))
+        await asyncio.sleep(0)
+        rejected = await call(application, http_scope('/api/cities'))
+        body_sent.set()
+        return rejected, await first
+
+    rejected, first = asyncio.run(run())
+    status, headers, _ = read_response(rejected)
+    assert status == 503
+    assert headers['retry-after'] == '1'
+    assert read_response(first)[0] == 200
+    assert application.in_flight == 0
+    application.executor.shutdown()
@@ -0,0 +1,90 @@
+# Tests that the binary chart frames read back, the way script.js reads them, as the json payload
+
+# Imports
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+BINARY = {'Accept': 'application/vnd.housing-trends.f32'}
+
+# Functions
+def parse_binary_frame(body):
+    '''Returns the header and the offset of the first value block, like
+    parseBinaryFrame in script.js.'''
+    assert body[:4] == b'HTF1'
+    (length,) = struct.unpack('<I', body[4:8])
+    header = json.loads(body[8:8 + length])
+    offset = 8 + length
+    # The page makes Float32Array views at this offset, which must be aligned
+    assert offset % 4 == 0
+    return header, offset
+
+def frame_labels(chart):
+    '''Returns the dates of a chart header, like frameLabels in script.js.'''
+    offsets = chart['offsets'] if chart['offsets'] is not None else range(chart['points'])
+    start = pd.Timestamp(chart['start'])
+    if chart['cadence'] == 'monthly':
+        return [(start.to_period('M') + step).end_time.strftime('%Y-%m-%d') for step in offsets]
+    return [(start + pd.Timedelta(days=7 * step)).strftime('%Y-%m-%d') for step in offsets]
+
+def read_frame_chart(body, chart, offset):
+    '''Returns the labels and datasets of one chart header with each dataset's
+    values read from its block, and the offset after the blocks, like
+    readFrameChart in script.js.'''
+    datasets = []
+    for dataset in chart['datasets']:
+        assert dataset['data'] is None
+        assert offset % 4 == 0
+        values = np.frombuffer(body, dtype='<f4', count=chart['points'], offset=offset)
+        datasets.append(dict(dataset, data=values))
+        offset += chart['points'] * 4
+    return frame_labels(chart), datasets, offset
+
+def assert_same_chart(labels, datasets, json_labels, json_datasets):
+    '''Checks a chart read from a frame against the json payload.'''
+    assert labels == json_labels
+    assert [dataset['regionId'] for dataset in datasets] == [dataset['regionId'] for dataset in json_datasets]
+    for dataset, json_dataset in zip(datasets, json_datasets):
+        assert {key: value for key, value in dataset.items() if key != 'data'} == \
+            {key: value for key, value in json_dataset.items() if key != 'data'}
+        expected = np.array([np.nan if value is None else value for value in json_dataset['data']], dtype='<f4')
+        np.testing.assert_array_equal(dataset['data'], expected)
+
+# Tests
+@pytest.mark.parametrize('query', ['ids=100001,100002,100003', 'ids=100003,100001&range=max&max_points=10',
+                                   'ids=100002&range=2y&max_points=5'])
+def test_chart_frame_matches_json(client, query):
+    expected = client.get(f'/api/pricedata?{query}').get_json()
+    response = client.get(f'/api/pricedata?{query}', headers=BINARY)
+    assert response.status_code == 200
+    assert response.mimetype == BINARY['Accept']
+    body = response.get_data()
+
+    header, offset = parse_binary_frame(body)
+    labels, datasets, offset = read_frame_chart(body, header, offset)
+    assert offset == len(body)
+    assert_same_chart(labels, datasets, expected['labels'], expected['datasets'])
+    if 'max_points' in query:
+        assert header['offsets'] is not None
+        assert header['points'] <= int(query.rsplit('=', 1)[1])
+
+@pytest.mark.parametrize('query', ['metrics=price,inventory&ids=100001,100002',
+                                   'metrics=inventory,price&ids=100002,100001&max_points=10'])
+def test_series_frame_matches_json(client, query):
+    expected = client.get(f'/api/series?{query}').get_json()
+    response = client.get(f'/api/series?{query}', headers=BINARY)
+    assert response.status_code == 200
+    body = response.get_data()
+
+    header, offset = parse_binary_frame(body)
+    # Blocks follow dataset-major within each metric, metrics in header order
+    assert list(header['series']) == list(expected['series'])
+    for metric, chart in header['series'].items():
+        labels, datasets, offset = read_frame_chart(body, chart, offset)
+        series = expected['series'][metric]
+        assert chart['cadence'] == series['cadence']
+        assert_same_chart(labels, datasets, expected['labels'][series['labels']], series['datasets'])
+    assert offset == len(body)
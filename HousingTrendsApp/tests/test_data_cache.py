@@ -0,0 +1,29 @@
+# Tests for the on-disk cache of transformed series
+
+# Imports
+import numpy as np
+import pytest
+
+import data_cache as dc
+from benchmarks.synthetic import write_zillow_csv
+from chart_engine import ChartEngine
+from derived_metrics import DERIVED_METRICS, derived_frame
+
+# Tests
+@pytest.mark.parametrize('mode', ['memory', 'mmap'])
+@pytest.mark.parametrize('derive', list(DERIVED_METRICS))
+def test_derived_metrics_are_stored_with_the_base_series(tmp_path, mode, derive):
+    house_csv = write_zillow_csv(tmp_path / 'Metro_mlp_uc_sfr_sm_month.csv', n_regions=30, n_months=40)
+    cache_dir = str(tmp_path / 'cache')
+    base = ChartEngine(dc.cached_transform(house_csv, cache_dir=cache_dir, mode=mode))
+
+    house = dc.cached_derived(house_csv, base.version, derive, cache_dir=cache_dir, mode=mode)
+    expected = derived_frame(base, derive)
+    assert house.attrs['version'] == expected.attrs['version']
+    assert list(house.columns) == list(expected.columns)
+    np.testing.assert_allclose(np.asarray(house.values), expected.to_numpy(), equal_nan=True)
+
+def test_derived_metrics_of_an_unknown_version(tmp_path):
+    house_csv = write_zillow_csv(tmp_path / 'Metro_mlp_uc_sfr_sm_month.csv', n_regions=10, n_months=24)
+    dc.cached_transform(house_csv, cache_dir=str(tmp_path / 'cache'))
+    assert dc.cached_derived(house_csv, '0' * 64, 'yoy', cache_dir=str(tmp_path / 'cache')) is None
@@ -0,0 +1,83 @@
+# Tests that an incremental ingest gives the same cache entry as a full transform
+
+# Imports
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_cache as dc
+import ingest
+from benchmarks.synthetic import zillow_frame
+
+N_NEW_MONTHS = 3
+
+# Functions
+def append_months(house):
+    return house
+
+def add_regions(house):
+    extra = house.iloc[1:4].copy()
+    extra['RegionID'] = [900_001, 900_002, 900_003]
+    extra['RegionName'] = ['Aardvark, TX', 'New Metro, CA', 'Zebra, FL']
+    return pd.concat([house, extra], ignore_index=True)
+
+def rename_regions(house):
+    house = house.copy()
+    house.loc[5, 'RegionName'] = 'Renamed Metro, TX'
+    house.loc[5, 'StateName'] = 'TX'
+    house.loc[9, 'SizeRank'] = 999
+    return house
+
+def drop_regions(house):
+    return house.drop(index=[2, 7, 30]).reset_index(drop=True)
+
+def drop_and_add_regions(house):
+    return add_regions(drop_regions(house))
+
+def write_drops(data_dir, change):
+    '''Writes the previous drop of a csv and returns its path and the csv
+    contents of the next drop, which has N_NEW_MONTHS more months and the
+    given change to its regions applied.'''
+    house = zillow_frame(n_regions=60, n_months=48, seed=3, gap_rate=0.0)
+    house_csv = str(data_dir / 'Metro_mlp_uc_sfr_sm_month.csv')
+    house.iloc[:, :-N_NEW_MONTHS].to_csv(house_csv, index=False)
+    return house_csv, change(house)
+
+def assert_same_entry(path, expected_path):
+    house = dc.load_frame(path)
+    expected = dc.load_frame(expected_path)
+    assert list(house.columns) == list(expected.columns)
+    assert list(house.index) == list(expected.index)
+    for name in ('region_ids', 'states', 'size_ranks', 'rollups'):
+        assert house.attrs[name] == expected.attrs[name], name
+    np.testing.assert_allclose(house.to_numpy(), expected.to_numpy(), rtol=1e-9)
+
+# Tests
+@pytest.mark.parametrize('change', [append_months, add_regions, rename_regions,
+                                    drop_regions, drop_and_add_regions])
+def test_incremental_ingest_matches_full_transform(tmp_path, change):
+    house_csv, next_drop = write_drops(tmp_path, change)
+    cache_dir = str(tmp_path / 'cache')
+    _, incremental = ingest.ingest(house_csv, cache_dir)
+    assert not incremental
+    assert dc.read_published(cache_dir)['Metro_mlp_uc_sfr_sm_month']['ingest']['mode'] == 'full'
+
+    next_drop.to_csv(house_csv, index=False)
+    path, incremental = ingest.ingest(house_csv, cache_dir)
+    assert incremental
+    assert dc.read_published(cache_dir)['Metro_mlp_uc_sfr_sm_month']['ingest']['mode'] == 'incremental'
+
+    dc.cached_transform(house_csv, cache_dir=str(tmp_path / 'full'))
+    key = dc.source_key(house_csv, ingest.f.home_price_inventory_transform, {})
+    assert_same_entry(path, dc.entry_dir(house_csv, key, str(tmp_path / 'full')))
+
+def test_dropped_regions_are_removed(tmp_path):
+    house_csv, next_drop = write_drops(tmp_path, drop_regions)
+    cache_dir = str(tmp_path / 'cache')
+    ingest.ingest(house_csv, cache_dir)
+    next_drop.to_csv(house_csv, index=False)
+    path, _ = ingest.ingest(house_csv, cache_dir)
+
+    region_ids = dc.read_meta(path)['region_ids']
+    assert set(region_ids) >= set(next_drop['RegionID'])
+    assert not set(region_ids) & {100_002, 100_007, 100_030}
@@ -0,0 +1,25 @@
+# Tests for the region name search index
+
+# Imports
+from search_index import CitySearchIndex
+
+NAMES = ['Aberdeen, SD', 'Abilene, TX', 'Akron, OH', 'Atlanta, GA', 'Austin, TX',
+         'Dallas, TX', 'Fort Worth, TX', 'Portland, OR', 'Portland, ME', 'All Metros, TX']
+SIZE_RANKS = [700, 160, 80, 8, 30, 4, 120, 25, 110, None]
+
+# Tests
+def test_larger_regions_come_first_within_a_match_type():
+    index = CitySearchIndex(NAMES, SIZE_RANKS)
+    assert index.search('a', 3) == ['Atlanta, GA', 'Austin, TX', 'Akron, OH']
+    assert index.search('portland') == ['Portland, OR', 'Portland, ME']
+
+def test_whole_name_matches_come_before_word_and_substring_matches():
+    index = CitySearchIndex(NAMES, SIZE_RANKS)
+    assert index.search('tx') == ['Dallas, TX', 'Austin, TX', 'Fort Worth, TX', 'Abilene, TX',
+                                  'All Metros, TX']
+    assert index.search('worth') == ['Fort Worth, TX']
+    assert index.search('tlan') == ['Atlanta, GA', 'Portland, OR', 'Portland, ME']
+
+def test_names_without_ranks_are_alphabetical():
+    index = CitySearchIndex(NAMES)
+    assert index.search('a', 3) == ['Aberdeen, SD', 'Abilene, TX', 'Akron, OH']
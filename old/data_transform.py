@@ -1,8 +1,24 @@
 # A file to store functions that transform the Zillow data
 
 # Imports
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 
+# Folder the transformed files are cached in
+CACHE_DIR = 'cache'
+
+# Part of every cache key; bump it when a transform changes so the cached
+# results are rebuilt
+CACHE_VERSION = 1
+
 # Functions
 def home_price_transform(house):
     '''Transforms the the Zillow Home Value Index dataframe into a format
@@ -18,4 +34,86 @@ def home_rent_transform(house):
     house = house.drop(columns=['RegionID', 'SizeRank'])
     house = house.set_index('RegionName')
     house = house.T
-    return house
\ No newline at end of file
+    return house
+
+# Transforms that load_all can run in a worker process, by name
+TRANSFORMS = {
+    'home_price_transform': home_price_transform,
+    'home_rent_transform': home_rent_transform,
+}
+
+def cache_path(house_csv, transform_name, cache_dir=CACHE_DIR):
+    '''Returns the cache folder for a csv and transform. The name is a hash
+    of the csv contents, the transform and CACHE_VERSION, so a new Zillow
+    file or a changed transform is transformed again.'''
+    digest = hashlib.sha256(f'v{CACHE_VERSION}:{transform_name}:'.encode())
+    with open(house_csv, 'rb') as csv_file:
+        for chunk in iter(lambda: csv_file.read(1 << 20), b''):
+            digest.update(chunk)
+    key = digest.hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(house_csv))[0]
+    return os.path.join(cache_dir, f'{stem}-{transform_name}-{key}')
+
+def transform_to_cache(house_csv, transform_name, cache_dir=CACHE_DIR):
+    '''Reads and transforms one csv and writes the result to the cache as a
+    .npy value matrix plus a json index of its rows and columns. Runs in a
+    worker process; only the returned path goes back to the parent, not
+    the dataframe.'''
+    path = cache_path(house_csv, transform_name, cache_dir)
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        return path
+    house = TRANSFORMS[transform_name](pd.read_csv(house_csv))
+    values = house.to_numpy()
+    if values.dtype == object:
+        # Rows that are not numbers (e.g. RegionType in the rent file) become NaN
+        values = pd.to_numeric(pd.Series(values.ravel()), errors='coerce').to_numpy().reshape(values.shape)
+    values = values.astype('float64')
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+    np.save(os.path.join(tmp_path, 'values.npy'), values)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as meta_file:
+        json.dump({'index': [str(row) for row in house.index],
+                   'columns': [str(column) for column in house.columns]}, meta_file)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another process cached the same file first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    # Drop the entries of older versions of the csv
+    prefix = os.path.basename(path).rsplit('-', 1)[0] + '-'
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name != os.path.basename(path):
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+    return path
+
+def load_cached(path):
+    '''Loads a cached transform as a dataframe over a read-only memory map.'''
+    with open(os.path.join(path, 'meta.json')) as meta_file:
+        meta = json.load(meta_file)
+    values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+    return pd.DataFrame(values, index=pd.Index(meta['index']),
+                        columns=pd.Index(meta['columns'], name='RegionName'))
+
+def load_all(files, cache_dir=CACHE_DIR, workers=None):
+    '''Reads and transforms many Zillow csv files at once. files maps a name
+    to a (csv, transform name) pair; returns a dict of the same names to the
+    transformed dataframes.
+
+    The files are transformed in a pool of worker processes (one per file,
+    up to the number of cores), which write their results to the disk cache
+    instead of pickling dataframes back. Unchanged files are read straight
+    from the cache. Where processes cannot be forked the files are
+    transformed one after another.'''
+    jobs = list(files.items())
+    workers = min(len(jobs), workers or os.cpu_count() or 1)
+    csvs = [house_csv for _, (house_csv, _) in jobs]
+    transforms = [transform_name for _, (_, transform_name) in jobs]
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        # Forked workers do not re-import the app module that called us
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            paths = list(pool.map(transform_to_cache, csvs, transforms, [cache_dir] * len(jobs)))
+    else:
+        paths = [transform_to_cache(house_csv, name, cache_dir) for house_csv, name in zip(csvs, transforms)]
+    return {name: load_cached(path) for (name, _), path in zip(jobs, paths)}
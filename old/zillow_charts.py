@@ -1,11 +1,11 @@
 # An app that displays the latest housing data from Zillow
 
 # Imports -----------------
+from functools import lru_cache
 from turtle import color
 import pandas as pd
  # Plotly
 import plotly.io as pio
-import plotly.express as px
 import plotly.graph_objects as go
  # Dash
 import dash
@@ -19,39 +19,43 @@ from dash_bootstrap_templates import load_figure_template
 import data_transform as dt
 
 # Data ---------------------
-# Data Imports
-home_prices = pd.read_csv('Metro_zhvi_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv') # Zillow Home Value Index - Smoothed; all homes; seasonally adjusted
-inventory = pd.read_csv('Metro_invt_fs_uc_sfrcondo_sm_month.csv') # For Sale Inventory - Smoothed; all homes; weekly
-list_sale_price = pd.read_csv('Metro_median_sale_price_uc_sfrcondo_sm_sa_month.csv') # Median Sales Price - Smoothed; all homes; monthly
-mean_days_to_pending = pd.read_csv('Metro_mean_doz_pending_uc_sfrcondo_sm_month.csv') # Mean sale to list ratio - Smoothed; all homes; weekly
-price_cuts = pd.read_csv('Metro_perc_listings_price_cut_uc_sfrcondo_sm_month.csv') # Share of Listings with a Price cut - smoothed; all homes; weekly
-percent_below_list = pd.read_csv('Metro_pct_sold_below_list_uc_sfrcondo_sm_month.csv') # Percent of Home Sold below List Price - smoothed; all homes; weekly
-rent = pd.read_csv('Metro_zori_uc_sfrcondomfr_sm_month.csv') # Rental Prices; all homes
-
-zhvi_sfh = pd.read_csv('Metro_zhvi_uc_sfr_tier_0.33_0.67_sm_sa_month.csv')
-zhvi_condos = pd.read_csv('Metro_zhvi_uc_condo_tier_0.33_0.67_sm_sa_month.csv')
-zhvi_1bdr = pd.read_csv('Metro_zhvi_bdrmcnt_1_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv')
-zhvi_2bdr = pd.read_csv('Metro_zhvi_bdrmcnt_2_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv')
-zhvi_3bdr = pd.read_csv('Metro_zhvi_bdrmcnt_3_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv')
-zhvi_4bdr = pd.read_csv('Metro_zhvi_bdrmcnt_4_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv')
-zhvi_5bdr = pd.read_csv('Metro_zhvi_bdrmcnt_5_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv')
-
-# Data Transforms
-home_pricesT = dt.home_price_transform(home_prices)
-inventoryT = dt.home_price_transform(inventory)
-list_sale_priceT = dt.home_price_transform(list_sale_price)
-mean_days_to_pendingT = dt.home_price_transform(mean_days_to_pending)
-price_cutsT = dt.home_price_transform(price_cuts)
-percent_below_listT = dt.home_price_transform(percent_below_list)
-rentT = dt.home_rent_transform(rent)
-
-zhvi_sfhT = dt.home_price_transform(zhvi_sfh)
-zhvi_condosT = dt.home_price_transform(zhvi_condos)
-zhvi_1bdrT = dt.home_price_transform(zhvi_1bdr)
-zhvi_2bdrT = dt.home_price_transform(zhvi_2bdr)
-zhvi_3bdrT = dt.home_price_transform(zhvi_3bdr)
-zhvi_4bdrT = dt.home_price_transform(zhvi_4bdr)
-zhvi_5bdrT = dt.home_price_transform(zhvi_5bdr)
+# Zillow csv files and the transform each one needs. load_all reads and
+# transforms them in parallel worker processes and caches the results.
+ZILLOW_FILES = {
+    'home_prices': ('Metro_zhvi_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv', 'home_price_transform'), # Zillow Home Value Index - Smoothed; all homes; seasonally adjusted
+    'inventory': ('Metro_invt_fs_uc_sfrcondo_sm_month.csv', 'home_price_transform'), # For Sale Inventory - Smoothed; all homes; weekly
+    'list_sale_price': ('Metro_median_sale_price_uc_sfrcondo_sm_sa_month.csv', 'home_price_transform'), # Median Sales Price - Smoothed; all homes; monthly
+    'mean_days_to_pending': ('Metro_mean_doz_pending_uc_sfrcondo_sm_month.csv', 'home_price_transform'), # Mean sale to list ratio - Smoothed; all homes; weekly
+    'price_cuts': ('Metro_perc_listings_price_cut_uc_sfrcondo_sm_month.csv', 'home_price_transform'), # Share of Listings with a Price cut - smoothed; all homes; weekly
+    'percent_below_list': ('Metro_pct_sold_below_list_uc_sfrcondo_sm_month.csv', 'home_price_transform'), # Percent of Home Sold below List Price - smoothed; all homes; weekly
+    'rent': ('Metro_zori_uc_sfrcondomfr_sm_month.csv', 'home_rent_transform'), # Rental Prices; all homes
+
+    'zhvi_sfh': ('Metro_zhvi_uc_sfr_tier_0.33_0.67_sm_sa_month.csv', 'home_price_transform'),
+    'zhvi_condos': ('Metro_zhvi_uc_condo_tier_0.33_0.67_sm_sa_month.csv', 'home_price_transform'),
+    'zhvi_1bdr': ('Metro_zhvi_bdrmcnt_1_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv', 'home_price_transform'),
+    'zhvi_2bdr': ('Metro_zhvi_bdrmcnt_2_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv', 'home_price_transform'),
+    'zhvi_3bdr': ('Metro_zhvi_bdrmcnt_3_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv', 'home_price_transform'),
+    'zhvi_4bdr': ('Metro_zhvi_bdrmcnt_4_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv', 'home_price_transform'),
+    'zhvi_5bdr': ('Metro_zhvi_bdrmcnt_5_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv', 'home_price_transform'),
+}
+
+# Data Imports and Transforms
+frames = dt.load_all(ZILLOW_FILES)
+home_pricesT = frames['home_prices']
+inventoryT = frames['inventory']
+list_sale_priceT = frames['list_sale_price']
+mean_days_to_pendingT = frames['mean_days_to_pending']
+price_cutsT = frames['price_cuts']
+percent_below_listT = frames['percent_below_list']
+rentT = frames['rent']
+
+zhvi_sfhT = frames['zhvi_sfh']
+zhvi_condosT = frames['zhvi_condos']
+zhvi_1bdrT = frames['zhvi_1bdr']
+zhvi_2bdrT = frames['zhvi_2bdr']
+zhvi_3bdrT = frames['zhvi_3bdr']
+zhvi_4bdrT = frames['zhvi_4bdr']
+zhvi_5bdrT = frames['zhvi_5bdr']
 
 num_beds = {
     'All Single Family Homes' : zhvi_sfhT,
@@ -111,129 +115,91 @@ app.layout = dbc.Container(
     fluid=True,
     className="dbc"
 )
-# Callback for Home Value Estimate
-@app.callback(
-    Output(component_id='home_prices_graph', component_property='figure'), # Output graph
-    Input(component_id='city_selection', component_property='value') # Input dropdown city selections
-)
-def update_graph(city_selection):
-    home_selection = home_pricesT[city_selection] # New dataframe with only columns from selection
-    # Makes the Bootstrap Themed Plotly templates available
-    load_figure_template(theme_choice)
-    fig = px.line(home_selection, x=home_selection.index, y=home_selection.columns) # Graph with new dataframe
-    fig.update_layout(title='Zillow Home Value Index - i.e. the typical home value for each region',
-                   xaxis_title='Date',
-                   yaxis_title='Home Value ($)',
-                   height=600,
-                   template=theme_choice)
-    return fig
-
-# Callback for Home Value Estimate based on Bedrooms
-@app.callback(
-    Output(component_id='bedroom_prices_graph', component_property='figure'), # Output graph
-    Input(component_id='bed_selection', component_property='value'),
-    Input(component_id='city_selection', component_property='value') # Input dropdown city selections
-)
-def update_graph(bed_selection, city_selection):
-    home_type = num_beds[bed_selection]
-    home_selection = home_type[city_selection] # New dataframe with only columns from selection
-    fig = px.line(home_selection, x=home_selection.index, y=home_selection.columns) # Graph with new dataframe
-    fig.update_layout(title='Zillow Home Value Index for the Type of Home Selected',
-                   xaxis_title='Date',
-                   yaxis_title='Home Value ($)',
-                   height=600,
-                   template=theme_choice)
-    return fig
-
-# Callback for Inventory Levels
-@app.callback(
-    Output(component_id='inventory_graph', component_property='figure'), # Output graph
-    Input(component_id='city_selection', component_property='value') # Input dropdown city selections
-)
-def update_graph(cities):
-    home_selection = inventoryT[cities] # New dataframe with only columns from selection
-    fig = px.line(home_selection, x=home_selection.index, y=home_selection.columns) # Graph with new dataframe
-    fig.update_layout(title='Home Inventory Levels',
-                   xaxis_title='Date',
-                   yaxis_title='Number of Homes for Sale',
-                   height=600,
-                   template=theme_choice)
-    return fig
-
-# Callback for Sale Price
-@app.callback(
-    Output(component_id='list_price_graph', component_property='figure'), # Output graph
-    Input(component_id='city_selection', component_property='value') # Input dropdown city selections
-)
-def update_graph(cities):
-    home_selection = list_sale_priceT[cities] # New dataframe with only columns from selection
-    fig = px.line(home_selection, x=home_selection.index, y=home_selection.columns) # Graph with new dataframe
-    fig.update_layout(title='Median Sale Price (All homes, monthly)',
-                   xaxis_title='Date',
-                   yaxis_title='Price ($)',
-                   height=600,
-                   template=theme_choice)
-    return fig
-
-# Callback for List to Sale
-@app.callback(
-    Output(component_id='mean_days_to_pending_graph', component_property='figure'), # Output graph
-    Input(component_id='city_selection', component_property='value') # Input dropdown city selections
-)
-def update_graph(cities):
-    home_selection = mean_days_to_pendingT[cities] # New dataframe with only columns from selection
-    fig = px.line(home_selection, x=home_selection.index, y=home_selection.columns) # Graph with new dataframe
-    fig.update_layout(title='Mean Days to Pending Sale',
-                   xaxis_title='Date',
-                   yaxis_title='Days',
-                   height=600,
-                   template=theme_choice)
-    return fig
-
-# Callback for Price Cuts
-@app.callback(
-    Output(component_id='price_cut_graph', component_property='figure'), # Output graph
-    Input(component_id='city_selection', component_property='value') # Input dropdown city selections
-)
-def update_graph(cities):
-    home_selection = price_cutsT[cities] # New dataframe with only columns from selection
-    fig = px.line(home_selection, x=home_selection.index, y=home_selection.columns) # Graph with new dataframe
-    fig.update_layout(title='Share of Listings with a Price Cut (All home types)',
-                   xaxis_title='Date',
-                   yaxis_title='Percent of Homes with a Price Cut (%)',
-                   height=600,
-                   template=theme_choice)
-    return fig  
-
-# Percent of Homes Sold Below the List Price
-@app.callback(
-    Output(component_id='percent_below_list_graph', component_property='figure'), # Output graph
-    Input(component_id='city_selection', component_property='value') # Input dropdown city selections
-)
-def update_graph(cities):
-    home_selection = percent_below_listT[cities] # New dataframe with only columns from selection
-    fig = px.line(home_selection, x=home_selection.index, y=home_selection.columns) # Graph with new dataframe
-    fig.update_layout(title='Percent of Homes Sold Below the List Price',
-                   xaxis_title='Date',
-                   yaxis_title='Percent of Homes Sold below List (%)',
-                   height=600,
-                   template=theme_choice)
-    return fig   
-
-# Callback for Rental Rates
+# Figures -----------------
+# Makes the Bootstrap Themed Plotly templates available
+load_figure_template(theme_choice)
+
+# Series each graph can show, by name; the bedroom graph shows the
+# 'beds:<home type>' series picked in bed_selection
+SERIES = {
+    'home_prices': home_pricesT,
+    'inventory': inventoryT,
+    'list_sale_price': list_sale_priceT,
+    'mean_days_to_pending': mean_days_to_pendingT,
+    'price_cuts': price_cutsT,
+    'percent_below_list': percent_below_listT,
+    'rent': rentT,
+}
+SERIES.update({f'beds:{home_type}': frame for home_type, frame in num_beds.items()})
+
+# Dates of each series, parsed once. Rows that are not dates (the rent
+# file's RegionType and StateName rows) are left out of the traces.
+SERIES_DATES = {name: pd.to_datetime(frame.index, format='%Y-%m-%d', errors='coerce')
+                for name, frame in SERIES.items()}
+
+# Graphs: output id, series (None for the bedroom graph), title and y axis title
+GRAPHS = [
+    ('home_prices_graph', 'home_prices', 'Zillow Home Value Index - i.e. the typical home value for each region', 'Home Value ($)'),
+    ('bedroom_prices_graph', None, 'Zillow Home Value Index for the Type of Home Selected', 'Home Value ($)'),
+    ('inventory_graph', 'inventory', 'Home Inventory Levels', 'Number of Homes for Sale'),
+    ('list_price_graph', 'list_sale_price', 'Median Sale Price (All homes, monthly)', 'Price ($)'),
+    ('mean_days_to_pending_graph', 'mean_days_to_pending', 'Mean Days to Pending Sale', 'Days'),
+    ('price_cut_graph', 'price_cuts', 'Share of Listings with a Price Cut (All home types)', 'Percent of Homes with a Price Cut (%)'),
+    ('percent_below_list_graph', 'percent_below_list', 'Percent of Homes Sold Below the List Price', 'Percent of Homes Sold below List (%)'),
+    ('rent_graph', 'rent', 'Monthly Rental Rate per Region', 'Rental Rate ($)'),
+]
+
+# Layout of each graph, with the theme template resolved once
+LAYOUTS = {
+    graph_id: go.Layout(title=title, xaxis_title='Date', yaxis_title=yaxis_title,
+                        height=600, template=theme_choice).to_plotly_json()
+    for graph_id, _, title, yaxis_title in GRAPHS
+}
+
+# Most (series, metro) traces kept; each is one metro's line on one graph
+TRACE_CACHE_SIZE = 2048
+
+@lru_cache(maxsize=TRACE_CACHE_SIZE)
+def metro_trace(series, metro):
+    """Returns one metro's line for a series as a validated Scattergl trace
+    in plotly json form, or None if the series has no such metro. Traces
+    are kept in an LRU, so a selection change only builds the traces of
+    the newly added metros."""
+    frame = SERIES[series]
+    if metro not in frame.columns:
+        return None
+    dates = SERIES_DATES[series]
+    valid = ~dates.isna()
+    return go.Scattergl(x=dates[valid], y=frame[metro].to_numpy()[valid],
+                        name=metro, mode='lines').to_plotly_json()
+
+def graph_figure(graph_id, series, cities):
+    """Returns the figure of one graph as a plain dict of cached traces and
+    its precomputed layout, so no figure is validated again."""
+    traces = (metro_trace(series, city) for city in cities)
+    return {'data': [trace for trace in traces if trace is not None], 'layout': LAYOUTS[graph_id]}
+
+# One callback for every graph, so a selection change is one round trip
 @app.callback(
-    Output(component_id='rent_graph', component_property='figure'), # Output graph
-    Input(component_id='city_selection', component_property='value') # Input dropdown city selections
+    [Output(component_id=graph_id, component_property='figure') for graph_id, _, _, _ in GRAPHS], # Output graphs
+    Input(component_id='city_selection', component_property='value'), # Input dropdown city selections
+    Input(component_id='bed_selection', component_property='value') # Input dropdown home type
 )
-def update_graph(cities):
-    home_selection = rentT[cities] # New dataframe with only columns from selection
-    fig = px.line(home_selection, x=home_selection.index, y=home_selection.columns) # Graph with new dataframe
-    fig.update_layout(title='Monthly Rental Rate per Region',
-                   xaxis_title='Date',
-                   yaxis_title='Rental Rate ($)',
-                   height=600,
-                   template=theme_choice)
-    return fig 
+def update_graphs(city_selection, bed_selection):
+    if isinstance(city_selection, str):
+        city_selection = [city_selection]
+    cities = list(city_selection or [])
+    # A new home type only changes the bedroom graph
+    bed_only = dash.ctx.triggered_id == 'bed_selection'
+    figures = []
+    for graph_id, series, _, _ in GRAPHS:
+        if series is None:
+            figures.append(graph_figure(graph_id, f'beds:{bed_selection}', cities))
+        elif bed_only:
+            figures.append(dash.no_update)
+        else:
+            figures.append(graph_figure(graph_id, series, cities))
+    return figures
 
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file